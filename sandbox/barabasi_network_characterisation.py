@@ -2,9 +2,9 @@ import networkx as nx
 import numpy as np
 import matplotlib.pyplot as plt
 
-import matplotlib as mpl
-
-from networkx import algorithms as alg
+from network_loader import graph_to_csr
+from metric_store import betweenness_centrality, stress_layout, coreness
+from network_drawing import edge_segments, draw_network
 
 OUTPUT_PATH = "./output/"
 CMAP_STYLE = "winter"
@@ -13,15 +13,19 @@ NETWORK_NAME = "barabasi"
 NODE_SIZE = 5
 EDGE_WIDTH = 0.1
 
-"""FROM GML FORMAT"""
-# G = nx.read_gml(f"./data/{NETWORK_NAME}.gml", label="id")
+# Target error of the sampled betweenness centrality (None: exact C_B)
+CB_EPSILON = None
+# Quality of the network layout: "draft", "normal" or "high"
+LAYOUT_QUALITY = "normal"
 
-"""# FROM .TXT FILE"""
-# G = nx.read_edgelist(
-#     f"data/{NETWORK_NAME}.txt", create_using=nx.Graph(), nodetype=int)
+"""FROM data/ (.gml or .txt file, cleaned and cached by network_loader)"""
+# G = load_network(NETWORK_NAME)
 
 """From network model"""
-G = nx.barabasi_albert_graph(n=1000, m=3)
+# Seeded as in barabasi_process_simulation_each_node.py: the same network,
+# whose metrics are computed once and then read from the metric store
+GRAPH_SEED = 30
+G = nx.barabasi_albert_graph(n=1000, m=3, seed=GRAPH_SEED)
 # G = nx.watts_strogatz_graph(1000, 5, 0.1)
 # G = nx.erdos_renyi_graph(1000, 0.02)
 
@@ -32,14 +36,13 @@ G = G.subgraph(sorted(nx.connected_components(G), key=len, reverse=True)[0])
 degree_sequence = sorted((d for n, d in G.degree()), reverse=True)
 dmax = max(degree_sequence)
 
-centrality = alg.betweenness_centrality(G)
+centrality = betweenness_centrality(G, epsilon=CB_EPSILON)
 centralities = [v for _, v in centrality.items()]
 
-corenesses = [3]*len(G.nodes)
-current_shell = nx.core.k_shell(G, k=3)
-final_layer = 3
-for node in G.nodes:
-    G.nodes[node]["layer"] = final_layer
+corenesses = coreness(G)
+for node, layer in zip(G.nodes, corenesses):
+    G.nodes[node]["layer"] = layer
+final_layer = corenesses.max()
 
 fig = plt.figure(f"Analysis of the {NETWORK_NAME} network",
                  figsize=(8, 8))
@@ -48,9 +51,13 @@ axgrid = fig.add_gridspec(5, 6)
 
 ax0 = fig.add_subplot(axgrid[0:3, :])
 # pos = nx.spring_layout(G, seed=10396953)
-pos = nx.kamada_kawai_layout(G)
-nx.draw_networkx_nodes(G, pos, ax=ax0, node_size=NODE_SIZE)
-nx.draw_networkx_edges(G, pos, ax=ax0, alpha=0.4, width=EDGE_WIDTH)
+pos = stress_layout(G, quality=LAYOUT_QUALITY)
+# Edge geometry, built once and reused by every drawing of the network
+positions = np.array([pos[node] for node in G.nodes])
+indptr, indices = graph_to_csr(G)
+segments = edge_segments(indptr, indices, positions)
+draw_network(ax0, positions, segments, node_size=NODE_SIZE,
+             edge_width=EDGE_WIDTH)
 ax0.set_title(f"Connected components of the {NETWORK_NAME} network")
 ax0.set_axis_off()
 
@@ -82,7 +89,8 @@ fig = plt.figure(f"{NETWORK_NAME} network and outer shell", figsize=(12, 6))
 
 """Plot a specific shell layer for the given network (final layer)"""
 desired_layer = final_layer
-shell = nx.core.k_shell(G, k=desired_layer)
+shell = G.subgraph(
+    [n for n in G.nodes if G.nodes[n]["layer"] == desired_layer])
 
 # Create a gridspec for adding subplots of different sizes
 axgrid = fig.add_gridspec(6, 6)
@@ -91,8 +99,8 @@ nodes_color = [
     'red' if G.nodes[n]["layer"] == desired_layer else 'blue' for n in G.nodes]
 
 ax0 = fig.add_subplot(axgrid[:, 0:3])
-nx.draw(G, node_color=nodes_color, node_size=NODE_SIZE,
-        width=EDGE_WIDTH, pos=pos)
+draw_network(ax0, positions, segments, node_color=nodes_color,
+             node_size=NODE_SIZE, edge_width=EDGE_WIDTH, edge_alpha=1.0)
 ax0.set_title(
     f"Charachterisation of the {NETWORK_NAME} network - outer shell in red")
 ax0.set_axis_off()
@@ -100,8 +108,11 @@ ax0.set_axis_off()
 ax1 = fig.add_subplot(axgrid[:, 3:])
 Gcc = shell.subgraph(sorted(
     nx.connected_components(shell), key=len, reverse=True)[0])
-nx.draw_networkx_nodes(Gcc, pos, ax=ax1, node_size=NODE_SIZE, node_color="red")
-nx.draw_networkx_edges(Gcc, pos, ax=ax1, alpha=0.4, width=EDGE_WIDTH)
+in_gcc = [node in Gcc for node in G.nodes]
+draw_network(ax1, positions,
+             edge_segments(indptr, indices, positions, nodes=in_gcc),
+             node_color="red", node_size=NODE_SIZE, edge_width=EDGE_WIDTH,
+             nodes=in_gcc)
 ax1.set_title(f"Outer shell of the {NETWORK_NAME} network (detail)")
 ax1.set_axis_off()
 
@@ -112,13 +123,10 @@ plt.savefig(OUTPUT_PATH + f"network_and_outer_shell_{NETWORK_NAME}.png")
 """Characterise shell layer that each node belongs to"""
 fig, ax = plt.subplots()
 colors = [G.nodes[i]["layer"] for i in list(G.nodes)]
-norm = mpl.colors.Normalize(vmin=min(colors), vmax=max(colors))
-fig.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=CMAP_STYLE),
-             ax=ax, label='Coreness ($k_S$)')
-nx.draw_networkx_nodes(
-    G, pos, node_size=NODE_SIZE,
-    node_color=colors, cmap=CMAP_STYLE, ax=ax)
-nx.draw_networkx_edges(G, pos, alpha=0.4, ax=ax, width=EDGE_WIDTH)
+nodes = draw_network(ax, positions, segments, node_color=colors,
+                     cmap=CMAP_STYLE, node_size=NODE_SIZE,
+                     edge_width=EDGE_WIDTH)
+fig.colorbar(nodes, ax=ax, label='Coreness ($k_S$)')
 plt.title("Coreness ($k_S$) of each node")
 plt.tight_layout()
 plt.savefig(OUTPUT_PATH + f"node_coreness_characterisation_{NETWORK_NAME}.png")
@@ -127,13 +135,10 @@ plt.savefig(OUTPUT_PATH + f"node_coreness_characterisation_{NETWORK_NAME}.png")
 """Characterise degree of each node"""
 fig, ax = plt.subplots()
 colors = [tup[1] for tup in list(G.degree())]
-norm = mpl.colors.Normalize(vmin=min(colors), vmax=max(colors))
-fig.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=CMAP_STYLE),
-             ax=ax, label='Degree ($k$)')
-nx.draw_networkx_nodes(
-    G, pos, node_size=NODE_SIZE,
-    node_color=colors, cmap=CMAP_STYLE, ax=ax)
-nx.draw_networkx_edges(G, pos, alpha=0.4, ax=ax, width=EDGE_WIDTH)
+nodes = draw_network(ax, positions, segments, node_color=colors,
+                     cmap=CMAP_STYLE, node_size=NODE_SIZE,
+                     edge_width=EDGE_WIDTH)
+fig.colorbar(nodes, ax=ax, label='Degree ($k$)')
 plt.title("Degree ($k$) of each node")
 plt.tight_layout()
 plt.savefig(OUTPUT_PATH + f"node_degree_characterisation_{NETWORK_NAME}.png")
@@ -142,13 +147,10 @@ plt.savefig(OUTPUT_PATH + f"node_degree_characterisation_{NETWORK_NAME}.png")
 """Characterise betweenness centrality of each node"""
 fig, ax = plt.subplots()
 colors = list(centrality.values())
-norm = mpl.colors.Normalize(vmin=min(colors), vmax=max(colors))
-fig.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=CMAP_STYLE),
-             ax=ax, label='Betweenness Centrality ($C_B$)')
-nx.draw_networkx_nodes(
-    G, pos, node_size=NODE_SIZE,
-    node_color=colors, cmap=CMAP_STYLE, ax=ax)
-nx.draw_networkx_edges(G, pos, alpha=0.4, ax=ax, width=EDGE_WIDTH)
+nodes = draw_network(ax, positions, segments, node_color=colors,
+                     cmap=CMAP_STYLE, node_size=NODE_SIZE,
+                     edge_width=EDGE_WIDTH)
+fig.colorbar(nodes, ax=ax, label='Betweenness Centrality ($C_B$)')
 plt.title("Betweenness Centrality $C_B$ of each node")
 plt.tight_layout()
 plt.savefig(
@@ -158,38 +160,28 @@ plt.savefig(
 """Coreness"""
 fig, ax = plt.subplots(nrows=1, ncols=3, figsize=(12, 4))
 colors = [G.nodes[i]["layer"] for i in list(G.nodes)]
-norm = mpl.colors.Normalize(vmin=min(colors), vmax=max(colors))
-fig.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=CMAP_STYLE),
-             ax=ax[0], label='Coreness ($k_S$)')
-nx.draw_networkx_nodes(
-    G, pos, node_size=NODE_SIZE,
-    node_color=colors, cmap=CMAP_STYLE, ax=ax[0])
-nx.draw_networkx_edges(G, pos, alpha=0.4, ax=ax[0], width=EDGE_WIDTH)
+nodes = draw_network(ax[0], positions, segments, node_color=colors,
+                     cmap=CMAP_STYLE, node_size=NODE_SIZE,
+                     edge_width=EDGE_WIDTH)
+fig.colorbar(nodes, ax=ax[0], label='Coreness ($k_S$)')
 ax[0].set_title("Coreness ($k_S$) of each node")
 
 
 """Degree"""
 colors = [tup[1] for tup in list(G.degree())]
-norm = mpl.colors.Normalize(vmin=min(colors), vmax=max(colors))
-fig.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=CMAP_STYLE),
-             ax=ax[1], label='Degree ($k$)')
-nx.draw_networkx_nodes(
-    G, pos, node_size=NODE_SIZE,
-    node_color=colors, cmap=CMAP_STYLE, ax=ax[1])
-nx.draw_networkx_edges(G, pos, alpha=0.4, ax=ax[1], width=EDGE_WIDTH)
+nodes = draw_network(ax[1], positions, segments, node_color=colors,
+                     cmap=CMAP_STYLE, node_size=NODE_SIZE,
+                     edge_width=EDGE_WIDTH)
+fig.colorbar(nodes, ax=ax[1], label='Degree ($k$)')
 ax[1].set_title("Degree ($k$) of each node")
 
 
 """Betweenness Centrality"""
-centrality = alg.betweenness_centrality(G)
 colors = list(centrality.values())
-norm = mpl.colors.Normalize(vmin=min(colors), vmax=max(colors))
-fig.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=CMAP_STYLE),
-             ax=ax[2], label='Betweenness Centrality ($C_B$)')
-nx.draw_networkx_nodes(
-    G, pos, node_size=NODE_SIZE,
-    node_color=colors, cmap=CMAP_STYLE, ax=ax[2])
-nx.draw_networkx_edges(G, pos, alpha=0.4, ax=ax[2], width=EDGE_WIDTH)
+nodes = draw_network(ax[2], positions, segments, node_color=colors,
+                     cmap=CMAP_STYLE, node_size=NODE_SIZE,
+                     edge_width=EDGE_WIDTH)
+fig.colorbar(nodes, ax=ax[2], label='Betweenness Centrality ($C_B$)')
 ax[2].set_title("Betweenness Centrality $C_B$ of each node")
 plt.tight_layout()
 plt.savefig(
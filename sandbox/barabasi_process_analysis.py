@@ -1,42 +1,61 @@
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy import io
-import math
 
 import networkx as nx
-from networkx import algorithms as alg
 
-
-def resize_image(im, nR, nC):
-    # simple image scaling to (n × C) size def scale(im, nR, nC):
-    nR0 = len(im)
-    nC0 = len(im[0])  # source number of columns
-    return [[im[int(nR0 * r / nR)][int(nC0 * c / nC)]
-             for c in range(nC)] for r in range(nR)]
+from metric_store import betweenness_centrality, coreness
+from spreading_analysis import (
+    bin_index, mean_grid, report_sampling, bin_edges, binned_index,
+    display_edges, histogram_grid, major_outbreaks)
+from results_store import load_results, results_graph
+from instrumentation import lap, log_event
 
 
 OUTPUT = "output/"
 DEBUGGING = "debugging/"
 
+# Binning of the betweenness centrality C_B axis of the heatmaps
+CB_BINNING = "log"  # "linear", "log" or "quantile"
+NUM_CB_BINS = 25
+# Target error of the sampled betweenness centrality (None: exact C_B),
+# relative to each node's C_B if CB_RELATIVE. Log and quantile C_B bins
+# need the relative error, at most 0.2 to keep the bins of nearly all the
+# nodes (see betweenness_approximation_check.py), which takes almost every
+# node as a source: sampling only pays off with linear bins
+CB_EPSILON = None
+CB_RELATIVE = True
+# Outbreaks reaching at least this fraction of the network are major ones
+# (the threshold is rounded to an edge of the size bins of the results)
+MAJOR_OUTBREAK_FRACTION = 0.1
+
 # ----------------------------------------------------------------------- #
 # get logged variable for plot debugging
-mdic = io.loadmat(DEBUGGING + "/sir_simulation_barabasi_beta17.mat")
-NETWORK_NAME = mdic["NETWORK_NAME"][0]
-M = mdic["M"][0]
-
-# Read the nework
-G = nx.barabasi_albert_graph(n=1000, m=3)
-
-# Input graph has self loops which is not permitted
-G.remove_edges_from(nx.selfloop_edges(G))
-G = G.subgraph(sorted(nx.connected_components(G), key=len, reverse=True)[0])
+results, metadata = load_results(DEBUGGING + "sir_simulation_barabasi_beta17",
+                                 mmap=True)
+NETWORK_NAME = metadata["network_name"]
+M = results["M"]
+
+# The random graph the simulation ran on is stored with its results; the
+# .mat files of the previous format only have M, and a new graph has to be
+# drawn (whose nodes M does not really belong to), seeded so that its
+# metrics are only computed once (see metric_store)
+GRAPH_SEED = 30
+if "indptr" in results:
+    G = results_graph(results)
+else:
+    G = nx.barabasi_albert_graph(n=1000, m=3, seed=GRAPH_SEED)
+    # Input graph has self loops which is not permitted
+    G.remove_edges_from(nx.selfloop_edges(G))
+    G = G.subgraph(
+        sorted(nx.connected_components(G), key=len, reverse=True)[0])
+
+lap("load")
 
 """Attribute to each node in the network its k_s (coreness) value"""
-corenesses = [3]*len(G.nodes)
-current_shell = nx.core.k_shell(G, k=3)
-final_layer = 3
-for node in G.nodes:
-    G.nodes[node]["layer"] = final_layer
+corenesses = coreness(G)
+for node, layer in zip(G.nodes, corenesses):
+    G.nodes[node]["layer"] = layer
+final_layer = corenesses.max()
 
 """Attribute to each node in the network its k (degree) value"""
 degrees = [tup[1] for tup in list(G.degree())]
@@ -44,47 +63,45 @@ for i, node in enumerate(G.nodes):
     G.nodes[node]["degree"] = degrees[i]
 
 """Attribute to each node in the network its C_B (betweenness centrality)"""
-centralities = alg.betweenness_centrality(G)
+centralities = betweenness_centrality(
+    G, epsilon=CB_EPSILON, relative=CB_RELATIVE)
 for node in G.nodes:
     G.nodes[node]["centrality"] = centralities[node]
 
+lap("metrics")
+
 # Compute M(k_s, k): the average size of the population Mi infected in
 # an epidemic originating at node i with a given (k_s, k), averaged over all
 # origins with the same (k_s, k) values
 
 unique_degrees = np.unique(degrees)
-unique_centralities = np.unique([v for _, v in centralities.items()])
+cb_edges = bin_edges([v for _, v in centralities.items()], NUM_CB_BINS,
+                     CB_BINNING)
 unique_coreness = np.unique(corenesses)
 
+# Row/column of the grids in which each node falls, in G.nodes order (as M)
+coreness_index = bin_index(corenesses, unique_coreness)
+degree_index = bin_index(degrees, unique_degrees)
+centrality_index = binned_index(
+    [centralities[node] for node in G.nodes], cb_edges)
+
 # +-------------------------------------------------------------------------+
 # |   k-shell index vs degree k outcome of spreading prediction             |
 # +-------------------------------------------------------------------------+
 
-# create object where to store the data for each of the plots, with the right
-# dimensions. Each entry will correspond to a unique (k_s, k), and thus
-# store the corresonding M(k_s, k)
-ks_vs_degree = np.zeros((len(unique_degrees), len(unique_coreness)))
+# Each entry of the grids will correspond to a unique (k_s, k), and thus
+# store the corresonding M(k_s, k), as well as the number of nodes averaged
 square_aspect_ratio_ks_k = 1 / (unique_degrees[-1] - unique_degrees[0])
 
-# row index: coreness ks
-# column index: degree k
-for row_index, k in zip(
-        range(0, len(ks_vs_degree)), unique_degrees):
-    for column_index, ks in zip(
-            range(0, len(ks_vs_degree[row_index])), unique_coreness):
-        count = 0
-        sum = 0
-        for i, node in enumerate(G.nodes):
-            if G.nodes[node]["layer"] == ks and G.nodes[node]["degree"] == k:
-                count += 1
-                sum += M[i]
-        if count != 0:
-            ks_vs_degree[row_index][column_index] = sum / count
+# row index: degree k
+# column index: coreness ks
+ks_vs_degree, ks_vs_degree_counts = mean_grid(
+    degree_index, coreness_index, M,
+    (len(unique_degrees), len(unique_coreness)))
+report_sampling("M(k_s, k)", ks_vs_degree_counts)
 
 # Convert data from absolute M(k_s, k) to percentual M(k_s, k)
-for i in range(0, len(ks_vs_degree)):
-    for j in range(0, len(ks_vs_degree[i])):
-        ks_vs_degree[i][j] = ks_vs_degree[i][j] / len(G.nodes) * 100
+ks_vs_degree = ks_vs_degree / len(G.nodes) * 100
 
 # Visualize in the colormap grid format:
 fig, ax = plt.subplots(1, 1)
@@ -103,54 +120,38 @@ ax.set_ylabel("Degree $k$")
 plt.colorbar(im0, ax=ax, label='$M$(%)')
 plt.savefig(
     OUTPUT + f'ks_vs_k_spreading_prediction_{NETWORK_NAME}.png')
+lap("ks_vs_k_figure")
 
 
 # +-------------------------------------------------------------------------+
 # |k-shell index vs betweenness centrality C_B spreading outcome prediction |
 # +-------------------------------------------------------------------------+
 
-# create object where to store the data for each of the plots, with the right
-# dimensions. Each entry will correspond to a unique (k_s, k), and thus
-# store the corresonding M(k_s, k)
-ks_vs_cb = np.zeros((len(unique_centralities), len(unique_coreness), ))
-square_aspect_ratio_ks_cb = 1 / (unique_centralities[-1]
-                                 - unique_centralities[0])
-
-# row index: coreness ks
-# column index: betweennes centrality cb
-for row_index, cb in zip(
-        range(0, len(ks_vs_cb)), unique_centralities):
-    for column_index, ks in zip(
-            range(0, len(ks_vs_cb[row_index])), unique_coreness):
-        count = 0
-        sum = 0
-        for i, node in enumerate(G.nodes):
-            if G.nodes[node]["layer"] == ks and G.nodes[
-                    node]["centrality"] == cb:
-                count += 1
-                sum += M[i]
-        if count != 0:
-            ks_vs_cb[row_index][column_index] = sum / count
+# Each entry of the grids will correspond to a unique (k_s, k), and thus
+# store the corresonding M(k_s, k), as well as the number of nodes averaged
+# row index: betweennes centrality cb
+# column index: coreness ks
+ks_vs_cb, ks_vs_cb_counts = mean_grid(
+    centrality_index, coreness_index, M,
+    (len(cb_edges) - 1, len(unique_coreness)))
+report_sampling("M(k_s, C_B)", ks_vs_cb_counts)
 
-# Convert data from absolute M(k_s, k) to percentual M(k_s, k)
-for i in range(0, len(ks_vs_cb)):
-    for j in range(0, len(ks_vs_cb[i])):
-        ks_vs_cb[i][j] = ks_vs_cb[i][j] / len(G.nodes) * 100
+# Convert data from absolute M(k_s, C_B) to percentual M(k_s, C_B)
+ks_vs_cb = ks_vs_cb / len(G.nodes) * 100
 
 # Visualize in the colormap grid format:
 fig, ax = plt.subplots(1, 1)
-donwsizing_ratio = 30
-im0 = ax.imshow(resize_image(ks_vs_cb, len(ks_vs_cb[:, 0]) // donwsizing_ratio,
-                             len(ks_vs_cb[0, :])), cmap='jet',
-                aspect=square_aspect_ratio_ks_cb,
-                extent=(2, 4,
-                        0, np.max(unique_centralities)),
-                origin="lower", interpolation="none")
+x_edges = np.linspace(2, 4, len(unique_coreness) + 1)
+# With log bins, the nodes with C_B = 0 have a row of their own at the bottom
+y_edges, zero_row = display_edges(cb_edges, CB_BINNING == "log")
+im0 = ax.pcolormesh(x_edges, y_edges, ks_vs_cb, cmap='jet')
+if CB_BINNING == "log":
+    ax.set_yscale("log")
+if zero_row is not None:
+    ax.set_yticks([zero_row], labels=["0"], minor=True)
+ax.set_box_aspect(1)
 xlim = (2, 4)
-ylim = (np.min(unique_centralities), np.max(unique_centralities))
-y_labels = np.linspace(
-    np.min(unique_centralities),
-    math.floor(np.max(unique_centralities)*100)/100, 5)
+ylim = (y_edges[0], y_edges[-1])
 ax.set_xlim(xlim)
 ax.set_ylim(ylim)
 ax.set_xticks([int(c) for c in unique_coreness])
@@ -159,47 +160,31 @@ ax.set_ylabel("Betweenness Centrality $C_B$")
 plt.colorbar(im0, ax=ax, label='$M$(%)')
 plt.savefig(
     OUTPUT + f'ks_vs_cb_spreading_prediction_{NETWORK_NAME}.png')
+lap("ks_vs_cb_figure")
 
-k_vs_cb = np.zeros((len(unique_centralities), len(unique_degrees)))
-square_aspect_ratio_k_cb = (unique_degrees[-1] - unique_degrees[0]
-                            ) / (unique_centralities[-1] -
-                                 unique_centralities[0])
-donwsizing_ratio = 30
-# row index: coreness ks
-# column index: betweennes centrality cb
-for row_index, cb in zip(
-        range(0, len(k_vs_cb)), unique_centralities):
-    for column_index, k in zip(
-            range(0, len(k_vs_cb[row_index])), unique_degrees):
-        count = 0
-        sum = 0
-        for i, node in enumerate(G.nodes):
-            if G.nodes[node]["degree"] == k and G.nodes[
-                    node]["centrality"] == cb:
-                count += 1
-                sum += M[i]
-        if count != 0:
-            k_vs_cb[row_index][column_index] = sum / count
+# row index: betweennes centrality cb
+# column index: degree k
+k_vs_cb, k_vs_cb_counts = mean_grid(
+    centrality_index, degree_index, M,
+    (len(cb_edges) - 1, len(unique_degrees)))
+report_sampling("M(k, C_B)", k_vs_cb_counts)
 
-# Convert data from absolute M(k_s, k) to percentual M(k_s, k)
-for i in range(0, len(k_vs_cb)):
-    for j in range(0, len(k_vs_cb[i])):
-        k_vs_cb[i][j] = k_vs_cb[i][j] / len(G.nodes) * 100
+# Convert data from absolute M(k, C_B) to percentual M(k, C_B)
+k_vs_cb = k_vs_cb / len(G.nodes) * 100
 
 # Visualize in the colormap grid format:
 fig, ax = plt.subplots(1, 1)
-donwsizing_ratio = 100
-im0 = ax.imshow(resize_image(k_vs_cb, len(k_vs_cb[:, 0]) // donwsizing_ratio,
-                             len(k_vs_cb[0, :])), cmap='jet',
-                aspect=square_aspect_ratio_k_cb,
-                extent=(0, np.max(unique_degrees),
-                        0, np.max(unique_centralities)),
-                origin="lower", interpolation="none")
+x_edges = np.linspace(0, np.max(unique_degrees), len(unique_degrees) + 1)
+# With log bins, the nodes with C_B = 0 have a row of their own at the bottom
+y_edges, zero_row = display_edges(cb_edges, CB_BINNING == "log")
+im0 = ax.pcolormesh(x_edges, y_edges, k_vs_cb, cmap='jet')
+if CB_BINNING == "log":
+    ax.set_yscale("log")
+if zero_row is not None:
+    ax.set_yticks([zero_row], labels=["0"], minor=True)
+ax.set_box_aspect(1)
 xlim = (np.min(unique_degrees), np.max(unique_degrees))
-ylim = (np.min(unique_centralities), np.max(unique_centralities))
-y_labels = np.linspace(
-    np.min(unique_centralities),
-    math.floor(np.max(unique_centralities)*100)/100, 5)
+ylim = (y_edges[0], y_edges[-1])
 ax.set_xlim(xlim)
 ax.set_ylim(ylim)
 ax.set_xlabel("Degree $k$")
@@ -207,3 +192,50 @@ ax.set_ylabel("Betweenness Centrality $C_B$")
 plt.colorbar(im0, ax=ax, label='$M$(%)')
 plt.savefig(
     OUTPUT + f'k_vs_cb_spreading_prediction_{NETWORK_NAME}.png')
+lap("k_vs_cb_figure")
+
+
+# +-------------------------------------------------------------------------+
+# |   Major outbreaks: P(major outbreak) and their M vs (k_s, k)            |
+# +-------------------------------------------------------------------------+
+
+# From the per-node histograms of final sizes of the results (the .mat files
+# of the previous format have none): the probability that an outbreak
+# started at a node of each (k_s, k) cell reaches MAJOR_OUTBREAK_FRACTION of
+# the network, and the average size of the outbreaks that do
+if "SIZE_HIST" not in results:
+    log_event("missing_size_histograms",
+              "No histograms of final sizes in the results, skipping the "
+              "major outbreak figures.")
+else:
+    # Stored with the graph, in the order of its nodes as M
+    size_hist, size_hist_sums = results["SIZE_HIST"], results["SIZE_HIST_SUMS"]
+    xlim = (2, 4,)
+    ylim = (np.min(unique_degrees), np.max(unique_degrees))
+    shape = (len(unique_degrees), len(unique_coreness))
+    major_probability, major_M, threshold = major_outbreaks(
+        histogram_grid(degree_index, coreness_index, size_hist, shape),
+        histogram_grid(degree_index, coreness_index, size_hist_sums, shape),
+        results["SIZE_BIN_EDGES"], MAJOR_OUTBREAK_FRACTION * len(G.nodes))
+
+    # Cells without any major outbreak (NaN) are left blank
+    fig, axes = plt.subplots(1, 2, figsize=(10, 4))
+    for ax, grid, label in zip(
+            axes, [major_probability * 100, major_M / len(G.nodes) * 100],
+            ["$P$(major outbreak) (%)", "$M$ of the major outbreaks (%)"]):
+        im0 = ax.imshow(grid, cmap='jet',
+                        aspect=square_aspect_ratio_ks_k,
+                        extent=(2, 4,
+                                0, np.max(unique_degrees)),
+                        origin="lower", interpolation="none")
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+        ax.set_xticks([int(c) for c in unique_coreness])
+        ax.set_xlabel("Coreness $k_S$")
+        ax.set_ylabel("Degree $k$")
+        plt.colorbar(im0, ax=ax, label=label)
+    fig.suptitle(f"Major outbreaks: at least {threshold} nodes")
+    fig.tight_layout()
+    plt.savefig(
+        OUTPUT + f'ks_vs_k_major_outbreaks_{NETWORK_NAME}.png')
+    lap("major_outbreaks_figure")
@@ -1,26 +1,28 @@
-import numpy as np
-from scipy import io
+import argparse
 
+import numpy as np
 import networkx as nx
 
-import ndlib.models.epidemics as ep
-import ndlib.models.ModelConfig as mconf
+from network_loader import graph_to_csr
+from spreading_sweep import run_sweep
+from percolation_engine import percolation_sweep
+from results_store import save_results
+from instrumentation import setup_logging, stage, profiled
 
 NETWORK_NAME = "barabasi"
 
 
 """Network selection in which to simulate the infection/spreading process"""
-"""FROM .GML FILE"""
-# G = nx.read_gml(f"data/{NETWORK_NAME}.gml", label="id")
+"""FROM data/ (.gml or .txt file, cleaned and cached by network_loader)"""
+# G = load_network(NETWORK_NAME)
 
 """FROM MODEL NETWORK"""
 # G = nx.erdos_renyi_graph(1000, 0.1)
 # G = nx.watts_strogatz_graph(1000, 5, 0.1)
-G = nx.barabasi_albert_graph(n=1000, m=3)
+# Seeded, so that every run (and --resume) is on the same network
+GRAPH_SEED = 30
+G = nx.barabasi_albert_graph(n=1000, m=3, seed=GRAPH_SEED)
 
-"""FROM .TXT FILE"""
-# G = nx.read_edgelist(
-#     f"data/{NETWORK_NAME}.txt", create_using=nx.Graph(), nodetype=int)
 # Input graph has self loops which is not permitted
 G.remove_edges_from(nx.selfloop_edges(G))
 G = G.subgraph(sorted(nx.connected_components(G), key=len, reverse=True)[0])
@@ -35,55 +37,91 @@ BETA = 0.17  # P(infectious node infecting a susceptible neighbour)
 GAMMA = 1.0  # P(infectious node becoming recovered after one timestep)
 NUM_ITERATIONS = 30  # Number of iterations for which to perform simulation
 NUM_REPETITION_EACH_NODE = 50  # Number of realisations for each starting node
+# Sequential sampling: with a target standard error of M[i] (in number of
+# nodes), realisations are added NUM_REPETITION_EACH_NODE at a time until it
+# is reached or MAX_REPETITION_EACH_NODE are done (None: fixed number)
+M_SE_TARGET = None
+MAX_REPETITION_EACH_NODE = 500
+# Number of starting nodes whose realisations are simulated as a single batch
+NUM_STARTING_NODES_PER_BATCH = 20
+NUM_WORKERS = None  # Number of worker processes (None: one per CPU core)
+MASTER_SEED = 30  # Seed from which every realisation's RNG stream is derived
+# With GAMMA = 1, M can instead be estimated for all the starting nodes at
+# once from NUM_PERCOLATION_SAMPLES bond percolation samples (no iteration
+# limit, see percolation_engine)
+USE_PERCOLATION = False
+NUM_PERCOLATION_SAMPLES = 1000
 
 OUTPUT = "output/"
 DEBUGGING = "debugging/"
-
-
-def configure_sir_model(
-        starting_node, network=G, beta=BETA, gamma=GAMMA):
-    """Configures the SIR infection model"""
-    model = ep.SIRModel(network)
-    config = mconf.Configuration()
-
-    config.add_model_parameter('beta', beta)  # P(infecting)
-    config.add_model_parameter('gamma', gamma)  # P(recovery) after 1 timestep
-    config.add_model_initial_configuration(
-        'Infected', [starting_node])
-    model.set_initial_status(config)
-    return model
-
-
-# Vector to store the Mis
-M = [0]*len(G.nodes)
-
-# Loop to start successively at each node in the network
-# Set the initial configuration, and the starting node
-for i, starting_node in enumerate(list(G.nodes)):
-
-    # Loop for the number of realisations to consider for each starting case
-    m = []  # store total number of infected nodes after each realisation
-    for _ in range(NUM_REPETITION_EACH_NODE):
-        # Need to reinitialise model parameters at each realisation
-        model = configure_sir_model(starting_node)
-        # Iterate the spreading process for NUM_ITERATIONS
-        iterations = model.iteration_bunch(NUM_ITERATIONS)
-        trends = model.build_trends(iterations)
-
-        # Size of the population infected, for this realisation
-        # In SIR infection model: number of "removed" nodes in last iteration
-        m.append(trends[0]["trends"]["node_count"][2][-1])
+# Per-node results are checkpointed here as the sweep goes (see --resume)
+CHECKPOINT = DEBUGGING + \
+    f"sir_simulation_{NETWORK_NAME}_beta{int(BETA * 100)}_checkpoint"
+
+
+"""Compact adjacency of G, on which the SIR engine advances the infection"""
+indptr, indices = graph_to_csr(G)
+node_ids = np.array(list(G.nodes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=f"SIR spreading sweep over the {NETWORK_NAME} network")
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="skip the starting nodes already done in the checkpoint left "
+             "by a previous (interrupted) run")
+    parser.add_argument(
+        "--log", metavar="PATH",
+        help="also log progress and timings as JSON lines to this file")
+    parser.add_argument(
+        "--profile", metavar="PATH",
+        help="dump a cProfile of the sweep to this file (with "
+             "NUM_WORKERS = 1, as the workers are not profiled)")
+    args = parser.parse_args()
+    setup_logging(args.log)
 
     # Average size of population M[i] infected, w/ epidemic starting at node i
-    M[i] = np.mean(m)
-    print(f"Progress: {round(i/NUMBER_NODES*100, 3)}.")
-
-
-# +-------------------------------------------------------------------------+
-# FROM HERE ON IS JUST ANALYSIS; SO LET'S SAVE TO .mat FILE
-# +-------------------------------------------------------------------------+
-mdic = {"M": M,
-        "NETWORK_NAME": NETWORK_NAME}
-io.savemat(
-    DEBUGGING + f"sir_simulation_{NETWORK_NAME}_beta{int(BETA * 100)}.mat",
-    mdic)
+    # In SIR infection model: number of "removed" nodes in last iteration
+    # Blocks of NUM_STARTING_NODES_PER_BATCH starting nodes are simulated in
+    # parallel; all NUM_REPETITION_EACH_NODE realisations of every starting
+    # node in a block run together, as the columns of a single state matrix
+    # Saved next to M: its standard error M_SE and 95% confidence interval
+    # M_CI, the NUM_REALISATIONS of each node, and TRUNCATED[i], the
+    # fraction of node i's realisations still active after the last of the
+    # NUM_ITERATIONS iterations (M[i] is then too low)
+    with profiled(args.profile), stage("simulation", network=NETWORK_NAME):
+        if USE_PERCOLATION:
+            if GAMMA != 1.0:
+                raise ValueError("Percolation only applies for GAMMA = 1.0.")
+            results = percolation_sweep(indptr, indices, BETA,
+                                        NUM_PERCOLATION_SAMPLES, MASTER_SEED)
+        else:
+            results = run_sweep(
+                indptr, indices, BETA, GAMMA, NUM_ITERATIONS,
+                NUM_REPETITION_EACH_NODE, MASTER_SEED,
+                num_workers=NUM_WORKERS,
+                nodes_per_batch=NUM_STARTING_NODES_PER_BATCH,
+                checkpoint_path=CHECKPOINT, resume=args.resume,
+                se_target=M_SE_TARGET,
+                max_realisations=MAX_REPETITION_EACH_NODE)
+
+    # +---------------------------------------------------------------------+
+    # FROM HERE ON IS JUST ANALYSIS; SO LET'S SAVE TO AN .npz RESULTS FILE
+    # +---------------------------------------------------------------------+
+    # Along with the node ids, the network and the parameters (see
+    # results_store), so that the analysis does not depend on reloading the
+    # network in the same node order; uncompressed, so that it memory-maps
+    # the columns instead of reading them whole
+    with stage("save", network=NETWORK_NAME):
+        save_results(
+            DEBUGGING + f"sir_simulation_{NETWORK_NAME}_beta"
+            f"{int(BETA * 100)}.npz", results, indptr, indices, node_ids,
+            NETWORK_NAME,
+            {"method": "percolation" if USE_PERCOLATION else "simulation",
+             "beta": BETA, "gamma": GAMMA, "num_iterations": NUM_ITERATIONS,
+             "num_realisations": (NUM_PERCOLATION_SAMPLES if USE_PERCOLATION
+                                  else NUM_REPETITION_EACH_NODE),
+             "se_target": M_SE_TARGET,
+             "max_realisations": MAX_REPETITION_EACH_NODE,
+             "master_seed": MASTER_SEED}, compressed=False)
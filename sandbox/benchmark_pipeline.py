@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+import tracemalloc
+
+import numpy as np
+import scipy
+import networkx as nx
+
+from network_loader import (
+    network_names, graph_to_csr, load_network_csr, read_network)
+from network_metrics import betweenness, sampled_betweenness, coreness
+from network_layout import stress_layout
+from sir_engine import simulate_sir_batch
+from sir_tuning import mean_field_threshold
+from spreading_sweep import run_sweep
+from percolation_engine import percolation_sweep
+from spreading_analysis import analysis_grids
+from worker_pool import adjacency_matrix
+
+"""Times every stage of the pipeline on the networks of data/ and on
+Barabasi-Albert graphs of increasing size, and writes the results as JSON"""
+BENCHMARKS = "benchmarks/"
+BA_SIZES = [1000, 2000, 4000, 8000]
+BA_M = 3
+# Stages whose cost grows too fast are only run on networks up to this size
+BETWEENNESS_MAX_NODES = 5000  # sampled C_B (epsilon below) beyond that
+BETWEENNESS_EPSILON = 0.005
+LAYOUT_MAX_NODES = 1000  # Kamada-Kawai only, stress_layout runs on all
+# SIR sweep parameters; beta is twice the mean field epidemic threshold of
+# each network, so that every network is benchmarked in a similar regime
+GAMMA = 1.0
+NUM_ITERATIONS = 30
+NUM_REALISATIONS = 10
+NUM_STARTING_NODES_PER_BATCH = 20
+NUM_PERCOLATION_SAMPLES = 200
+MASTER_SEED = 30
+CB_BINNING = "log"
+NUM_CB_BINS = 25
+
+
+def measure(function, *args, memory=True, **kwargs):
+    """Result of function(*args, **kwargs), the wall time it took (s) and
+    the peak memory (MB) allocated while it ran, as traced by tracemalloc
+
+    Tracing slows down Python-heavy code a lot, so the function is timed on
+    its own, and then run a second time to trace its memory (None with
+    memory=False)."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    if not memory:
+        return result, seconds, None
+    tracemalloc.start()
+    function(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def benchmark_network(name, load, num_workers, cached_load=None,
+                      memory=True):
+    """Benchmark records of all the stages on one network; load() returns
+    its (indptr, indices), and so does cached_load() if given, from an
+    already written cache. See measure for memory."""
+    records = []
+
+    def record(stage, function, *args, **kwargs):
+        result, seconds, peak = measure(function, *args, memory=memory,
+                                        **kwargs)
+        records.append({"network": name, "stage": stage,
+                        "seconds": seconds, "peak_memory_mb": peak})
+        print(f"{name} {stage}: {seconds:.3f} s" + (
+            f", {peak:.1f} MB." if memory else "."))
+        return result
+
+    indptr, indices = record("load", load)
+    if cached_load is not None:
+        cached_load()
+        record("load_cached", cached_load)
+    num_nodes = len(indptr) - 1
+
+    corenesses = record("coreness", coreness, indptr, indices)
+    if num_nodes <= BETWEENNESS_MAX_NODES:
+        centralities = record("betweenness", betweenness, indptr, indices,
+                              num_workers=num_workers)
+    else:
+        centralities, _ = record(
+            "betweenness_sampled", sampled_betweenness, indptr, indices,
+            epsilon=BETWEENNESS_EPSILON, seed=0)
+    record("stress_layout", stress_layout, indptr, indices)
+    if num_nodes <= LAYOUT_MAX_NODES:
+        record("kamada_kawai", lambda: nx.kamada_kawai_layout(
+            nx.from_scipy_sparse_array(adjacency_matrix(indptr, indices))))
+
+    beta = min(2 * mean_field_threshold(indptr), 1.0)
+    adjacency = adjacency_matrix(indptr, indices)
+    starting_nodes = np.repeat(np.arange(min(num_nodes, 100)), 10)
+    record("sir_batch", simulate_sir_batch, adjacency, starting_nodes, beta,
+           GAMMA, NUM_ITERATIONS, np.random.default_rng(MASTER_SEED))
+    records[-1]["realisations_per_second"] = (
+        len(starting_nodes) / records[-1]["seconds"])
+    results = record(
+        "sir_sweep", run_sweep, indptr, indices, beta, GAMMA, NUM_ITERATIONS,
+        NUM_REALISATIONS, MASTER_SEED, num_workers=num_workers,
+        nodes_per_batch=NUM_STARTING_NODES_PER_BATCH)
+    records[-1]["realisations_per_second"] = (
+        num_nodes * NUM_REALISATIONS / records[-1]["seconds"])
+    record("percolation_sweep", percolation_sweep, indptr, indices, beta,
+           NUM_PERCOLATION_SAMPLES, MASTER_SEED)
+    record("analysis_grids", analysis_grids, results["M"], corenesses,
+           np.diff(indptr), centralities, NUM_CB_BINS, CB_BINNING)
+
+    for entry in records:
+        entry.update(nodes=num_nodes, edges=len(indices) // 2, beta=beta)
+    return records
+
+
+def git_commit():
+    """Hash of the checked out commit, or None outside of a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(records, baseline_path):
+    """Prints the time ratio of every (network, stage) to a previous run"""
+    with open(baseline_path) as f:
+        baseline = {(entry["network"], entry["stage"]): entry
+                    for entry in json.load(f)["results"]}
+    for entry in records:
+        old = baseline.get((entry["network"], entry["stage"]))
+        if old is None:
+            continue
+        line = (f"{entry['network']} {entry['stage']}: "
+                f"{entry['seconds'] / old['seconds']:.2f}x time")
+        if None not in (entry["peak_memory_mb"], old["peak_memory_mb"]):
+            change = entry["peak_memory_mb"] - old["peak_memory_mb"]
+            line += f", {change:+.1f} MB peak memory"
+        print(line + ".")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the pipeline stages")
+    parser.add_argument("--networks", nargs="*", default=network_names(),
+                        help="networks of data/ to benchmark")
+    parser.add_argument("--ba-sizes", nargs="*", type=int, default=BA_SIZES,
+                        help="numbers of nodes of the Barabasi-Albert graphs")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for betweenness and sweeps")
+    parser.add_argument("--output", help="JSON file to write (default: "
+                        f"{BENCHMARKS}benchmark_<commit>.json)")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the second, memory traced run of every "
+                             "stage")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="previous benchmark to compare against")
+    args = parser.parse_args()
+
+    records = []
+    for network_name in args.networks:
+        def load():
+            return graph_to_csr(read_network(network_name))
+
+        def cached_load():
+            return load_network_csr(network_name)[:2]
+        records += benchmark_network(network_name, load, args.workers,
+                                     cached_load, not args.no_memory)
+    for num_nodes in args.ba_sizes:
+        def load():
+            return graph_to_csr(
+                nx.barabasi_albert_graph(num_nodes, BA_M, seed=MASTER_SEED))
+        records += benchmark_network(f"barabasi_{num_nodes}", load,
+                                     args.workers,
+                                     memory=not args.no_memory)
+
+    commit = git_commit()
+    report = {"commit": commit,
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": sys.version.split()[0],
+              "numpy": np.__version__,
+              "scipy": scipy.__version__,
+              "networkx": nx.__version__,
+              "platform": platform.platform(),
+              "cpu_count": os.cpu_count(),
+              "workers": args.workers,
+              "max_rss_mb": resource.getrusage(
+                  resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+              "results": records}
+    output = args.output or (
+        BENCHMARKS + f"benchmark_{(commit or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark written to {output}.")
+    if args.compare:
+        compare(records, args.compare)
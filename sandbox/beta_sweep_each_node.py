@@ -0,0 +1,30 @@
+from network_loader import load_network_csr
+from percolation_engine import beta_sweep
+from results_store import save_results
+
+"""M(beta) of every starting node, for a whole list of betas at once"""
+NETWORK_NAME = "email"
+indptr, indices, node_ids = load_network_csr(NETWORK_NAME)
+NUMBER_NODES = len(indptr) - 1
+print(f"The total number of nodes is {NUMBER_NODES}.")
+
+"""SIR infection model parameters (GAMMA = 1.0, as bond percolation)"""
+BETAS = [0.02, 0.04, 0.06, 0.08, 0.1, 0.12, 0.14, 0.16]
+NUM_PERCOLATION_SAMPLES = 1000  # Realisations for each starting node
+MASTER_SEED = 30  # Seed from which every sample's RNG stream is derived
+
+DEBUGGING = "debugging/"
+
+
+# M[i, k]: average size of the epidemic starting at node i for BETAS[k]; the
+# analysis scripts take out a single column with select_beta
+results = beta_sweep(indptr, indices, BETAS, NUM_PERCOLATION_SAMPLES,
+                     MASTER_SEED)
+for beta, M in zip(BETAS, results["M"].T):
+    print(f"beta = {beta}: M from {M.min():.1f} to {M.max():.1f} nodes.")
+
+save_results(DEBUGGING + f"sir_beta_sweep_{NETWORK_NAME}.npz", results, indptr,
+             indices, node_ids, NETWORK_NAME,
+             {"method": "percolation", "betas": BETAS, "gamma": 1.0,
+              "num_realisations": NUM_PERCOLATION_SAMPLES,
+              "master_seed": MASTER_SEED}, compressed=False)
@@ -0,0 +1,89 @@
+import numpy as np
+from scipy import stats
+
+from network_loader import load_network_csr
+from network_metrics import betweenness, sampled_betweenness, coreness
+from spreading_analysis import (
+    bin_index, mean_grid, bin_edges, binned_index)
+from spreading_sweep import run_sweep
+from results_store import load_results
+from instrumentation import log_event
+
+"""Compares the sampled betweenness centrality with the exact one, and how
+much the k_s vs C_B spreading prediction changes when using it"""
+DEBUGGING = "debugging/"
+
+# Networks for which the exact C_B is affordable, with the simulation
+# results to read M from (see results_store); None to simulate it here
+NETWORKS = {"karate": None,
+            "dolphins": "sir_simulation_dolphins",
+            "email": "sir_simulation_email_beta8",
+            "power": "sir_simulation_power_beta65"}
+# Target errors tried, absolute and relative to each node's C_B
+EPSILONS = {False: [0.01, 0.005, 0.002], True: [0.5, 0.2, 0.1]}
+CONFIDENCE = 0.95
+# Fraction of the nodes changing C_B bin above which an epsilon is flagged
+MAX_MOVED_FRACTION = 0.05
+CB_BINNING = "log"
+NUM_CB_BINS = 25
+
+# SIR parameters used to simulate M when there are no results to read
+BETA = 0.3
+GAMMA = 1.0
+NUM_ITERATIONS = 30
+NUM_REPETITION_EACH_NODE = 50
+
+
+def ks_vs_cb_grid(M, corenesses, centralities, edges):
+    """M(k_s, C_B) in percentage of the network, and the node counts"""
+    unique_coreness = np.unique(corenesses)
+    grid, counts = mean_grid(
+        binned_index(centralities, edges),
+        bin_index(corenesses, unique_coreness), M,
+        (len(edges) - 1, len(unique_coreness)))
+    return grid / len(M) * 100, counts
+
+
+for network_name, results_file in NETWORKS.items():
+    indptr, indices, _ = load_network_csr(network_name)
+    num_nodes = len(indptr) - 1
+    if results_file is None:
+        M = run_sweep(indptr, indices, BETA, GAMMA, NUM_ITERATIONS,
+                      NUM_REPETITION_EACH_NODE, master_seed=0,
+                      num_workers=1)["M"]
+    else:
+        M = load_results(DEBUGGING + results_file, columns=["M"],
+                         mmap=True)[0]["M"]
+    corenesses = coreness(indptr, indices)
+
+    exact = betweenness(indptr, indices)
+    edges = bin_edges(exact, NUM_CB_BINS, CB_BINNING)
+    exact_grid, exact_counts = ks_vs_cb_grid(M, corenesses, exact, edges)
+
+    for relative, epsilon in [(relative, epsilon)
+                              for relative, values in EPSILONS.items()
+                              for epsilon in values]:
+        approximate, num_sources = sampled_betweenness(
+            indptr, indices, epsilon=epsilon, confidence=CONFIDENCE, seed=0,
+            relative=relative)
+        grid, counts = ks_vs_cb_grid(M, corenesses, approximate, edges)
+        occupied = (counts > 0) | (exact_counts > 0)
+        moved = np.mean(binned_index(approximate, edges)
+                        != binned_index(exact, edges))
+        mode = "relative" if relative else "absolute"
+        print(f"{network_name} {mode} epsilon={epsilon}: "
+              f"{num_sources}/{num_nodes} sources, "
+              f"max |C_B error| = {np.abs(approximate - exact).max():.2e}, "
+              f"Spearman rho = {stats.spearmanr(approximate, exact)[0]:.4f}, "
+              f"{moved*100:.1f}% of nodes change C_B bin, "
+              f"mean |dM(k_s, C_B)| = "
+              f"{np.abs(grid - exact_grid)[occupied].mean():.2f} "
+              f"percentage points")
+        if moved > MAX_MOVED_FRACTION:
+            log_event("betweenness_check",
+                      f"WARNING: {mode} epsilon={epsilon} moves "
+                      f"{moved*100:.1f}% of the {network_name} nodes to "
+                      f"another {CB_BINNING} C_B bin (more than "
+                      f"{MAX_MOVED_FRACTION*100:g}%), use a smaller one.",
+                      network=network_name, epsilon=epsilon,
+                      relative=relative, moved_fraction=moved)
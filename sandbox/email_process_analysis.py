@@ -1,48 +1,68 @@
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy import io
-import math
 
-import networkx as nx
-from networkx import algorithms as alg
-
-
-def resize_image(im, nR, nC):
-    # simple image scaling to (n × C) size def scale(im, nR, nC):
-    nR0 = len(im)
-    nC0 = len(im[0])  # source number of columns
-    return [[im[int(nR0 * r / nR)][int(nC0 * c / nC)]
-             for c in range(nC)] for r in range(nR)]
+from network_loader import load_network
+from metric_store import betweenness_centrality, coreness
+from spreading_analysis import (
+    bin_index, mean_grid, report_sampling, bin_edges, binned_index,
+    display_edges, select_beta, histogram_grid, major_outbreaks)
+from results_store import load_results, align_to_graph
+from instrumentation import lap, log_event
 
 
 OUTPUT = "output/"
 DEBUGGING = "debugging/"
 
+# Binning of the betweenness centrality C_B axis of the heatmaps
+CB_BINNING = "log"  # "linear", "log" or "quantile"
+NUM_CB_BINS = 25
+# Target error of the sampled betweenness centrality (None: exact C_B),
+# relative to each node's C_B if CB_RELATIVE. Log and quantile C_B bins
+# need the relative error, at most 0.2 to keep the bins of nearly all the
+# nodes (see betweenness_approximation_check.py), which takes almost every
+# node as a source: sampling only pays off with linear bins
+CB_EPSILON = None
+CB_RELATIVE = True
+# M is read from the single beta simulation, or with SWEEP_BETA from the
+# M(beta) matrix of beta_sweep_each_node.py (.npz results, or the .mat file
+# of the previous format when there is none, see results_store)
+SWEEP_BETA = None
+# Outbreaks reaching at least this fraction of the network are major ones
+# (the threshold is rounded to an edge of the size bins of the results)
+MAJOR_OUTBREAK_FRACTION = 0.1
+# Columns of the histograms of final sizes, read along with M
+SIZE_COLUMNS = ["SIZE_HIST", "SIZE_HIST_SUMS", "SIZE_BIN_EDGES"]
+
 # ----------------------------------------------------------------------- #
 # get logged variable for plot debugging
-mdic = io.loadmat(DEBUGGING + "/sir_simulation_email_beta8.mat")
-NETWORK_NAME = mdic["NETWORK_NAME"][0]
-M = mdic["M"][0]
+if SWEEP_BETA is None:
+    results, metadata = load_results(DEBUGGING + "sir_simulation_email_beta8",
+                                     columns=["M", "node_ids"] + SIZE_COLUMNS,
+                                     mmap=True)
+    M = results["M"]
+else:
+    results, metadata = load_results(DEBUGGING + "sir_beta_sweep_email",
+                                     columns=["M", "BETAS", "node_ids"]
+                                     + SIZE_COLUMNS, mmap=True)
+    M = select_beta(results, SWEEP_BETA)
+NETWORK_NAME = metadata["network_name"]
 
 # Read the nework
-# G = nx.read_gml(f"data/{NETWORK_NAME}.gml", label="id")
-G = nx.read_edgelist(
-    f"data/{NETWORK_NAME}.txt", create_using=nx.Graph(), nodetype=int)
-# Input graph has self loops which is not permitted
-G.remove_edges_from(nx.selfloop_edges(G))
-G = G.subgraph(sorted(nx.connected_components(G), key=len, reverse=True)[0])
+G = load_network(NETWORK_NAME)
+# Model networks may have self loops and disconnected components
+# G.remove_edges_from(nx.selfloop_edges(G))
+# G = G.subgraph(
+#     sorted(nx.connected_components(G), key=len, reverse=True)[0])
+# M in the order of G.nodes, whatever the node order of the simulation
+M = align_to_graph(M, G, metadata, results.get("node_ids"))
+
+lap("load")
 
 """Attribute to each node in the network its k_s (coreness) value"""
-corenesses = []
-shell_layer = 0
-current_shell = nx.core.k_shell(G, k=shell_layer)
-while (len(current_shell.nodes) != 0 or shell_layer == 0):
-    for node in list(current_shell.nodes):
-        G.nodes[node]["layer"] = shell_layer
-        corenesses.append(shell_layer)
-    shell_layer += 1
-    current_shell = nx.core.k_shell(G, k=shell_layer)
-final_layer = shell_layer - 1
+corenesses = coreness(G)
+for node, layer in zip(G.nodes, corenesses):
+    G.nodes[node]["layer"] = layer
+final_layer = corenesses.max()
 
 """Attribute to each node in the network its k (degree) value"""
 degrees = [tup[1] for tup in list(G.degree())]
@@ -50,53 +70,50 @@ for i, node in enumerate(G.nodes):
     G.nodes[node]["degree"] = degrees[i]
 
 """Attribute to each node in the network its C_B (betweenness centrality)"""
-centralities = alg.betweenness_centrality(G)
+centralities = betweenness_centrality(
+    G, epsilon=CB_EPSILON, relative=CB_RELATIVE)
 for node in G.nodes:
     G.nodes[node]["centrality"] = centralities[node]
 
+lap("metrics")
+
 # Compute M(k_s, k): the average size of the population Mi infected in
 # an epidemic originating at node i with a given (k_s, k), averaged over all
 # origins with the same (k_s, k) values
 
 unique_degrees = np.unique(degrees)
-unique_centralities = np.unique([v for _, v in centralities.items()])
+cb_edges = bin_edges([v for _, v in centralities.items()], NUM_CB_BINS,
+                     CB_BINNING)
 unique_coreness = np.unique(corenesses)
 
+# Row/column of the grids in which each node falls, in G.nodes order (as M)
+coreness_index = bin_index(corenesses, unique_coreness)
+degree_index = bin_index(degrees, unique_degrees)
+centrality_index = binned_index(
+    [centralities[node] for node in G.nodes], cb_edges)
+
 # +-------------------------------------------------------------------------+
 # |   k-shell index vs degree k outcome of spreading prediction             |
 # +-------------------------------------------------------------------------+
 
-# create object where to store the data for each of the plots, with the right
-# dimensions. Each entry will correspond to a unique (k_s, k), and thus
-# store the corresonding M(k_s, k)
-ks_vs_degree = np.zeros((len(unique_degrees), len(unique_coreness)))
+# Each entry of the grids will correspond to a unique (k_s, k), and thus
+# store the corresonding M(k_s, k), as well as the number of nodes averaged
 square_aspect_ratio_ks_k = (unique_coreness[-1] - unique_coreness[0]
                             ) / (unique_degrees[-1] - unique_degrees[0])
 
-# row index: coreness ks
-# column index: degree k
-for row_index, k in zip(
-        range(0, len(ks_vs_degree)), unique_degrees):
-    for column_index, ks in zip(
-            range(0, len(ks_vs_degree[row_index])), unique_coreness):
-        count = 0
-        sum = 0
-        for i, node in enumerate(G.nodes):
-            if G.nodes[node]["layer"] == ks and G.nodes[node]["degree"] == k:
-                count += 1
-                sum += M[i]
-        if count != 0:
-            ks_vs_degree[row_index][column_index] = sum / count
+# row index: degree k
+# column index: coreness ks
+ks_vs_degree, ks_vs_degree_counts = mean_grid(
+    degree_index, coreness_index, M,
+    (len(unique_degrees), len(unique_coreness)))
+report_sampling("M(k_s, k)", ks_vs_degree_counts)
 
 # Convert data from absolute M(k_s, k) to percentual M(k_s, k)
-for i in range(0, len(ks_vs_degree)):
-    for j in range(0, len(ks_vs_degree[i])):
-        ks_vs_degree[i][j] = ks_vs_degree[i][j] / len(G.nodes) * 100
+ks_vs_degree = ks_vs_degree / len(G.nodes) * 100
 
 # Visualize in the colormap grid format:
 fig, ax = plt.subplots(1, 1)
-im0 = ax.imshow(resize_image(ks_vs_degree, len(ks_vs_degree[:, 0]) // 5,
-                             len(ks_vs_degree[0, :])), cmap='jet',
+im0 = ax.imshow(ks_vs_degree, cmap='jet',
                 aspect=square_aspect_ratio_ks_k,
                 extent=(0, np.max(unique_coreness),
                         0, np.max(unique_degrees)),
@@ -110,55 +127,38 @@ ax.set_ylabel("Degree $k$")
 plt.colorbar(im0, ax=ax, label='$M$(%)')
 plt.savefig(
     OUTPUT + f'ks_vs_k_spreading_prediction_{NETWORK_NAME}.png')
+lap("ks_vs_k_figure")
 
 
 # +-------------------------------------------------------------------------+
 # |k-shell index vs betweenness centrality C_B spreading outcome prediction |
 # +-------------------------------------------------------------------------+
 
-# create object where to store the data for each of the plots, with the right
-# dimensions. Each entry will correspond to a unique (k_s, k), and thus
-# store the corresonding M(k_s, k)
-ks_vs_cb = np.zeros((len(unique_centralities), len(unique_coreness), ))
-square_aspect_ratio_ks_cb = (unique_coreness[-1] - unique_coreness[0]
-                             ) / (unique_centralities[-1]
-                                  - unique_centralities[0])
-
-# row index: coreness ks
-# column index: betweennes centrality cb
-for row_index, cb in zip(
-        range(0, len(ks_vs_cb)), unique_centralities):
-    for column_index, ks in zip(
-            range(0, len(ks_vs_cb[row_index])), unique_coreness):
-        count = 0
-        sum = 0
-        for i, node in enumerate(G.nodes):
-            if G.nodes[node]["layer"] == ks and G.nodes[
-                    node]["centrality"] == cb:
-                count += 1
-                sum += M[i]
-        if count != 0:
-            ks_vs_cb[row_index][column_index] = sum / count
+# Each entry of the grids will correspond to a unique (k_s, k), and thus
+# store the corresonding M(k_s, k), as well as the number of nodes averaged
+# row index: betweennes centrality cb
+# column index: coreness ks
+ks_vs_cb, ks_vs_cb_counts = mean_grid(
+    centrality_index, coreness_index, M,
+    (len(cb_edges) - 1, len(unique_coreness)))
+report_sampling("M(k_s, C_B)", ks_vs_cb_counts)
 
-# Convert data from absolute M(k_s, k) to percentual M(k_s, k)
-for i in range(0, len(ks_vs_cb)):
-    for j in range(0, len(ks_vs_cb[i])):
-        ks_vs_cb[i][j] = ks_vs_cb[i][j] / len(G.nodes) * 100
+# Convert data from absolute M(k_s, C_B) to percentual M(k_s, C_B)
+ks_vs_cb = ks_vs_cb / len(G.nodes) * 100
 
 # Visualize in the colormap grid format:
 fig, ax = plt.subplots(1, 1)
-donwsizing_ratio = 5
-im0 = ax.imshow(resize_image(ks_vs_cb, len(ks_vs_cb[:, 0]) // 15,
-                             len(ks_vs_cb[0, :])), cmap='jet',
-                aspect=square_aspect_ratio_ks_cb,
-                extent=(0, len(unique_coreness),
-                        0, np.max(unique_centralities)),
-                origin="lower", interpolation="none")
+x_edges = np.linspace(0, len(unique_coreness), len(unique_coreness) + 1)
+# With log bins, the nodes with C_B = 0 have a row of their own at the bottom
+y_edges, zero_row = display_edges(cb_edges, CB_BINNING == "log")
+im0 = ax.pcolormesh(x_edges, y_edges, ks_vs_cb, cmap='jet')
+if CB_BINNING == "log":
+    ax.set_yscale("log")
+if zero_row is not None:
+    ax.set_yticks([zero_row], labels=["0"], minor=True)
+ax.set_box_aspect(1)
 xlim = (np.min(unique_coreness), np.max(unique_coreness))
-ylim = (np.min(unique_centralities), np.max(unique_centralities))
-y_labels = np.linspace(
-    np.min(unique_centralities),
-    math.floor(np.max(unique_centralities)*100)/100, 5)
+ylim = (y_edges[0], y_edges[-1])
 ax.set_xlim(xlim)
 ax.set_ylim(ylim)
 ax.set_xlabel("Coreness $k_S$")
@@ -166,3 +166,53 @@ ax.set_ylabel("Betweenness Centrality $C_B$")
 plt.colorbar(im0, ax=ax, label='$M$(%)')
 plt.savefig(
     OUTPUT + f'ks_vs_cb_spreading_prediction_{NETWORK_NAME}.png')
+lap("ks_vs_cb_figure")
+
+
+# +-------------------------------------------------------------------------+
+# |   Major outbreaks: P(major outbreak) and their M vs (k_s, k)            |
+# +-------------------------------------------------------------------------+
+
+# From the per-node histograms of final sizes of the results (the .mat files
+# of the previous format have none): the probability that an outbreak
+# started at a node of each (k_s, k) cell reaches MAJOR_OUTBREAK_FRACTION of
+# the network, and the average size of the outbreaks that do
+if "SIZE_HIST" not in results:
+    log_event("missing_size_histograms",
+              "No histograms of final sizes in the results, skipping the "
+              "major outbreak figures.")
+else:
+    # Histograms of the beta of M, in the order of G.nodes as M
+    size_hist, size_hist_sums = (
+        align_to_graph(results[field] if SWEEP_BETA is None
+                       else select_beta(results, SWEEP_BETA, field),
+                       G, metadata, results.get("node_ids"))
+        for field in ["SIZE_HIST", "SIZE_HIST_SUMS"])
+    xlim = (np.min(unique_coreness), np.max(unique_coreness))
+    ylim = (np.min(unique_degrees), np.max(unique_degrees))
+    shape = (len(unique_degrees), len(unique_coreness))
+    major_probability, major_M, threshold = major_outbreaks(
+        histogram_grid(degree_index, coreness_index, size_hist, shape),
+        histogram_grid(degree_index, coreness_index, size_hist_sums, shape),
+        results["SIZE_BIN_EDGES"], MAJOR_OUTBREAK_FRACTION * len(G.nodes))
+
+    # Cells without any major outbreak (NaN) are left blank
+    fig, axes = plt.subplots(1, 2, figsize=(10, 4))
+    for ax, grid, label in zip(
+            axes, [major_probability * 100, major_M / len(G.nodes) * 100],
+            ["$P$(major outbreak) (%)", "$M$ of the major outbreaks (%)"]):
+        im0 = ax.imshow(grid, cmap='jet',
+                        aspect=square_aspect_ratio_ks_k,
+                        extent=(0, np.max(unique_coreness),
+                                0, np.max(unique_degrees)),
+                        origin="lower", interpolation="none")
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+        ax.set_xlabel("Coreness $k_S$")
+        ax.set_ylabel("Degree $k$")
+        plt.colorbar(im0, ax=ax, label=label)
+    fig.suptitle(f"Major outbreaks: at least {threshold} nodes")
+    fig.tight_layout()
+    plt.savefig(
+        OUTPUT + f'ks_vs_k_major_outbreaks_{NETWORK_NAME}.png')
+    lap("major_outbreaks_figure")
@@ -0,0 +1,227 @@
+import os
+import hashlib
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # figures are only ever written to files
+import matplotlib.pyplot as plt
+from PIL import Image
+
+from network_drawing import draw_network
+from spreading_analysis import display_edges
+from worker_pool import process_pool
+
+"""PNG text chunk in which each figure keeps the fingerprint of its inputs"""
+INPUTS_KEY = "arc:inputs"
+
+
+def node_metrics_figure(positions, segments, values, labels, titles,
+                        cmap="winter", node_size=5, edge_width=0.1):
+    """The network coloured by one or more per-node metrics (values, one
+    array per metric), one subplot per metric"""
+    num_metrics = len(values)
+    fig, axes = plt.subplots(1, num_metrics, squeeze=False, figsize=(
+        None if num_metrics == 1 else (4 * num_metrics, 4)))
+    for ax, metric, label, title in zip(axes[0], values, labels, titles):
+        nodes = draw_network(ax, positions, segments, node_color=metric,
+                             cmap=cmap, node_size=node_size,
+                             edge_width=edge_width)
+        fig.colorbar(nodes, ax=ax, label=label)
+        ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
+
+def network_characterisation_figure(positions, segments, degrees,
+                                    centralities, corenesses, network_name,
+                                    node_size=5, edge_width=0.1):
+    """The network above the histograms of its degrees, betweenness
+    centralities and corenesses, as in the *_network_characterisation.py
+    scripts"""
+    fig = plt.figure(f"Analysis of the {network_name} network",
+                     figsize=(8, 8))
+    axgrid = fig.add_gridspec(5, 6)
+    ax0 = fig.add_subplot(axgrid[0:3, :])
+    draw_network(ax0, positions, segments, node_size=node_size,
+                 edge_width=edge_width)
+    ax0.set_title(f"Connected components of the {network_name} network")
+    ax0.set_axis_off()
+
+    unique_centralities = np.unique(centralities)
+    histograms = [
+        (axgrid[3:, :2], degrees, {}, "Degree histogram", "Degree"),
+        (axgrid[3:, 2:4], centralities,
+         {"width": np.mean(np.diff(unique_centralities)) * 50
+          if len(unique_centralities) > 1 else 0.8},
+         "Centrality histogram", "Betweenness Centrality"),
+        (axgrid[3:, 4:], corenesses, {}, "Coreness histogram", "Coreness")]
+    for cell, values, style, title, label in histograms:
+        ax = fig.add_subplot(cell)
+        ax.bar(*np.unique(values, return_counts=True), **style)
+        ax.set_title(title)
+        ax.set_xlabel(label)
+        ax.set_ylabel("# of Nodes")
+    fig.tight_layout()
+    return fig
+
+
+def network_and_shell_figure(positions, segments, in_shell, component,
+                             component_segments, network_name,
+                             node_size=5, edge_width=0.1):
+    """The network with the nodes of its inner shell (in_shell, a boolean
+    mask) in red, next to the largest connected component of that shell
+    (component, drawn with its component_segments), as in the
+    *_network_characterisation.py scripts"""
+    fig = plt.figure(f"{network_name} network and inner shell",
+                     figsize=(12, 6))
+    axgrid = fig.add_gridspec(6, 6)
+    ax0 = fig.add_subplot(axgrid[:, 0:3])
+    draw_network(ax0, positions, segments,
+                 node_color=np.where(in_shell, "red", "blue"),
+                 node_size=node_size, edge_width=edge_width, edge_alpha=1.0)
+    ax0.set_title(f"Characterisation of the {network_name} network - inner "
+                  f"shell in red")
+    ax0.set_axis_off()
+    ax1 = fig.add_subplot(axgrid[:, 3:])
+    draw_network(ax1, positions, component_segments, node_color="red",
+                 node_size=node_size, edge_width=edge_width, nodes=component)
+    ax1.set_title(f"Inner shell of the {network_name} network (detail)")
+    ax1.set_axis_off()
+    fig.tight_layout()
+    return fig
+
+
+def ks_vs_k_figure(grid, unique_coreness, unique_degrees, cmap="jet"):
+    """Heatmap of M(k_s, k) (in % of the network), as in the
+    *_process_analysis.py scripts"""
+    coreness_range = unique_coreness[-1] - unique_coreness[0]
+    degree_range = unique_degrees[-1] - unique_degrees[0]
+    fig, ax = plt.subplots(1, 1)
+    # Square heatmap, unless all nodes have the same k_s (e.g. BA graphs)
+    im0 = ax.imshow(grid, cmap=cmap,
+                    aspect=(coreness_range / degree_range
+                            if coreness_range > 0 and degree_range > 0
+                            else "auto"),
+                    extent=(0, np.max(unique_coreness),
+                            0, np.max(unique_degrees)),
+                    origin="lower", interpolation="none")
+    ax.set_xlim(np.min(unique_coreness), np.max(unique_coreness))
+    ax.set_ylim(np.min(unique_degrees), np.max(unique_degrees))
+    ax.set_xlabel("Coreness $k_S$")
+    ax.set_ylabel("Degree $k$")
+    fig.colorbar(im0, ax=ax, label='$M$(%)')
+    return fig
+
+
+def ks_vs_cb_figure(grid, unique_coreness, cb_edges, log_scale=True,
+                    cmap="jet"):
+    """Heatmap of M(k_s, C_B) (in % of the network) over the C_B bins given
+    by cb_edges, as in the *_process_analysis.py scripts"""
+    fig, ax = plt.subplots(1, 1)
+    x_edges = np.linspace(0, len(unique_coreness), len(unique_coreness) + 1)
+    y_edges, zero_row = display_edges(cb_edges, log_scale)
+    im0 = ax.pcolormesh(x_edges, y_edges, grid, cmap=cmap)
+    if log_scale:
+        ax.set_yscale("log")
+    if zero_row is not None:
+        ax.set_yticks([zero_row], labels=["0"], minor=True)
+    ax.set_box_aspect(1)
+    ax.set_xlim(np.min(unique_coreness), np.max(unique_coreness))
+    ax.set_ylim(y_edges[0], y_edges[-1])
+    ax.set_xlabel("Coreness $k_S$")
+    ax.set_ylabel("Betweenness Centrality $C_B$")
+    fig.colorbar(im0, ax=ax, label='$M$(%)')
+    return fig
+
+
+def k_vs_cb_figure(grid, unique_degrees, cb_edges, log_scale=True,
+                   cmap="jet"):
+    """Heatmap of M(k, C_B) (in % of the network) over the C_B bins given
+    by cb_edges, as in barabasi_process_analysis.py"""
+    fig, ax = plt.subplots(1, 1)
+    x_edges = np.linspace(0, np.max(unique_degrees), len(unique_degrees) + 1)
+    y_edges, zero_row = display_edges(cb_edges, log_scale)
+    im0 = ax.pcolormesh(x_edges, y_edges, grid, cmap=cmap)
+    if log_scale:
+        ax.set_yscale("log")
+    if zero_row is not None:
+        ax.set_yticks([zero_row], labels=["0"], minor=True)
+    ax.set_box_aspect(1)
+    ax.set_xlim(np.min(unique_degrees), np.max(unique_degrees))
+    ax.set_ylim(y_edges[0], y_edges[-1])
+    ax.set_xlabel("Degree $k$")
+    ax.set_ylabel("Betweenness Centrality $C_B$")
+    fig.colorbar(im0, ax=ax, label='$M$(%)')
+    return fig
+
+
+"""Figure kinds that render_figures knows, by name"""
+FIGURES = {"node_metrics": node_metrics_figure,
+           "network_characterisation": network_characterisation_figure,
+           "network_and_shell": network_and_shell_figure,
+           "ks_vs_k": ks_vs_k_figure,
+           "ks_vs_cb": ks_vs_cb_figure,
+           "k_vs_cb": k_vs_cb_figure}
+
+
+def inputs_fingerprint(kind, inputs):
+    """Content hash of a figure kind and of its inputs (arrays, sequences,
+    strings or numbers, by name)"""
+    digest = hashlib.sha256(kind.encode())
+    for name in sorted(inputs):
+        value = inputs[name]
+        digest.update(name.encode())
+        if value is None or isinstance(value, (bool, int, float, str)):
+            digest.update(repr(value).encode())
+        else:
+            value = np.ascontiguousarray(value)
+            digest.update(f"{value.dtype.str}{value.shape}".encode())
+            digest.update(value.tobytes())
+    return digest.hexdigest()
+
+
+def stored_fingerprint(path):
+    """Fingerprint of the inputs the PNG at path was rendered from, None if
+    there is no such PNG or it has none"""
+    try:
+        with Image.open(path) as image:
+            return image.text.get(INPUTS_KEY)
+    except OSError:
+        return None
+
+
+def render_figure(kind, path, inputs, fingerprint):
+    """Renders one figure to path, keeping the fingerprint of its inputs in
+    the PNG, in the process it is called from"""
+    fig = FIGURES[kind](**inputs)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fig.savefig(path, metadata={INPUTS_KEY: fingerprint})
+    plt.close(fig)
+    return path
+
+
+def render_figures(jobs, num_workers=None, force=False):
+    """Renders the figures of jobs, a list of (kind, path, inputs) with kind
+    one of FIGURES, called with the inputs dict as keyword arguments
+
+    A figure is skipped when its PNG was already rendered from the same
+    inputs (unless force), so that only the figures whose metrics, layout or
+    M changed are redrawn. The others are rendered by num_workers processes
+    (os.cpu_count() if None) with the Agg backend, forked where the platform
+    allows it. Returns the paths rendered and the paths skipped."""
+    pending, skipped = [], []
+    for kind, path, inputs in jobs:
+        fingerprint = inputs_fingerprint(kind, inputs)
+        if not force and stored_fingerprint(path) == fingerprint:
+            skipped.append(path)
+        else:
+            pending.append((kind, path, inputs, fingerprint))
+    if num_workers is None:
+        num_workers = os.cpu_count()
+
+    if num_workers == 1 or len(pending) <= 1:
+        rendered = [render_figure(*job) for job in pending]
+    else:
+        with process_pool(num_workers) as executor:
+            rendered = list(executor.map(render_figure, *zip(*pending)))
+    return rendered, skipped
@@ -0,0 +1,93 @@
+import sys
+import json
+import time
+import logging
+import cProfile
+from contextlib import contextmanager
+
+"""Logger of the pipeline; events carry their fields in record.fields"""
+LOGGER = logging.getLogger("arc")
+LOGGER.setLevel(logging.INFO)
+LOGGER.addHandler(logging.StreamHandler(sys.stdout))
+LOGGER.propagate = False
+
+"""Start of the current lap, see lap"""
+_lap_start = time.perf_counter()
+
+
+def _json_value(value):
+    """numpy scalars and arrays as plain Python values, anything else as
+    its string"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, event, message and the event fields"""
+
+    def format(self, record):
+        return json.dumps(dict(
+            {"time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+             "event": getattr(record, "event", None),
+             "message": record.getMessage()},
+            **getattr(record, "fields", {})), default=_json_value)
+
+
+def setup_logging(log_path=None):
+    """Also writes every event, as JSON lines, to log_path (if given)"""
+    if log_path is not None:
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(JsonFormatter())
+        LOGGER.addHandler(handler)
+
+
+def log_event(event, message, **fields):
+    """Logs message, and the event with its fields for the JSON log"""
+    LOGGER.info(message, extra={"event": event, "fields": fields})
+
+
+def format_duration(seconds):
+    """h:mm:ss representation of a duration"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+@contextmanager
+def stage(name, **fields):
+    """Times the block of code it wraps, logged as a stage event"""
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    log_event("stage", f"Stage {name} took {seconds:.3f} s.", stage=name,
+              seconds=seconds, **fields)
+
+
+def lap(name, **fields):
+    """Logs the time since the previous lap (or the import of this module)
+    as a stage event, for scripts that run top to bottom"""
+    global _lap_start
+    now = time.perf_counter()
+    log_event("stage", f"Stage {name} took {now - _lap_start:.3f} s.",
+              stage=name, seconds=now - _lap_start, **fields)
+    _lap_start = now
+
+
+@contextmanager
+def profiled(profile_path=None):
+    """Runs the block under cProfile and dumps the statistics (pstats
+    format, readable by snakeviz, flameprof or gprof2dot) to profile_path;
+    does nothing if it is None. Worker processes are not profiled."""
+    if profile_path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        log_event("profile", f"Profile written to {profile_path}.",
+                  path=profile_path)
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from network_loader import CACHE, graph_to_csr, save_atomically
+import network_metrics
+import network_layout
+from instrumentation import log_event
+
+"""Per-node metrics and layouts are stored here, one .npy file each"""
+METRICS = CACHE + "metrics/"
+
+
+def csr_fingerprint(indptr, indices, node_ids):
+    """Content hash of a network given by its CSR adjacency and the id of
+    the node of each row, see graph_fingerprint"""
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    upper = rows < indices
+    edges = np.stack((rows[upper], indices[upper]), axis=1)
+    edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+    digest = hashlib.sha256()
+    digest.update(np.asarray(node_ids).tobytes())
+    digest.update(edges.astype(np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def graph_fingerprint(G):
+    """Content hash of the network G, including the order of its nodes
+
+    Two graphs have the same fingerprint if they have the same nodes, in the
+    same order, and the same edges (whatever the order they were added in),
+    so per-node arrays computed on one of them line up with the other."""
+    return csr_fingerprint(*graph_to_csr(G), np.array(list(G.nodes)))
+
+
+def cached_metric(G, name, compute, **params):
+    """Per-node metric of G, computed once and then read from the store
+
+    The metric is looked up by the fingerprint of G, its name and the
+    parameters it is computed with. On a miss, compute(G, **params) is
+    called; it must return an array aligned with G.nodes, which is saved in
+    cache/metrics/ for the next scripts that need it."""
+    key = hashlib.sha256(json.dumps(
+        [graph_fingerprint(G), name, params], sort_keys=True).encode())
+    path = METRICS + f"{name}_{key.hexdigest()[:24]}.npy"
+    if os.path.exists(path):
+        return np.load(path)
+    values = np.asarray(compute(G, **params))
+    os.makedirs(METRICS, exist_ok=True)
+    save_atomically(path, np.save, values)
+    return values
+
+
+def _betweenness(G, epsilon=None, confidence=0.95, seed=0, relative=False,
+                 num_workers=1):
+    if epsilon is None:
+        return network_metrics.betweenness(
+            *graph_to_csr(G), num_workers=num_workers)
+    centrality, num_sources = network_metrics.sampled_betweenness(
+        *graph_to_csr(G), epsilon=epsilon, confidence=confidence, seed=seed,
+        relative=relative)
+    log_event("betweenness_sampling",
+              f"Betweenness centrality sampled from {num_sources}/"
+              f"{G.number_of_nodes()} source nodes.",
+              num_sources=num_sources, num_nodes=G.number_of_nodes(),
+              epsilon=epsilon, confidence=confidence, relative=relative)
+    return centrality
+
+
+def _stress_layout(G, quality="normal", seed=0):
+    return network_layout.stress_layout(
+        *graph_to_csr(G), quality=quality, seed=seed)
+
+
+def _coreness(G):
+    return network_metrics.coreness(*graph_to_csr(G))
+
+
+def betweenness_centrality(G, epsilon=None, confidence=0.95, seed=0,
+                           relative=False, num_workers=1):
+    """Betweenness centrality C_B of each node, as {node: C_B} like networkx
+
+    By default C_B is exact, computed by num_workers processes (one per CPU
+    core if None). Only code under a __main__ guard should ask for more than
+    one: where workers are spawned, they import the calling script again.
+    With a target error epsilon, it is estimated from sampled source nodes
+    instead, so that the confidence interval of every node's C_B is within
+    +-epsilon, or +-epsilon * C_B if relative (see sampled_betweenness)."""
+    params = {} if epsilon is None else {
+        "epsilon": epsilon, "confidence": confidence, "seed": seed,
+        "relative": relative}
+
+    def compute(G, **params):
+        return _betweenness(G, num_workers=num_workers, **params)
+    return dict(zip(G.nodes, cached_metric(
+        G, "betweenness", compute, **params)))
+
+
+def stress_layout(G, quality="normal", seed=0):
+    """Sparse stress layout of the network (see network_layout), as
+    {node: (x, y)} like networkx; scales to networks far too large for
+    networkx's Kamada-Kawai layout"""
+    return dict(zip(G.nodes, cached_metric(
+        G, "stress_layout", _stress_layout, quality=quality, seed=seed)))
+
+
+def coreness(G):
+    """Coreness k_s of each node, as an array aligned with G.nodes"""
+    return cached_metric(G, "coreness", _coreness)
@@ -0,0 +1,49 @@
+import numpy as np
+from matplotlib.collections import LineCollection
+
+"""Default node colour, the same as networkx's"""
+NODE_COLOR = "#1f78b4"
+
+
+def edge_segments(indptr, indices, positions, nodes=None):
+    """(edges x 2 x 2) array of the end points of every edge, from the CSR
+    adjacency and the (nodes x 2) positions aligned with its rows
+
+    Built once per network and layout, and then reused by draw_network for
+    every colouring of the nodes. With nodes (a boolean mask over the
+    nodes), only the edges between two of those nodes are kept."""
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    keep = rows < indices
+    if nodes is not None:
+        nodes = np.asarray(nodes, dtype=bool)
+        keep &= nodes[rows] & nodes[indices]
+    return np.stack((positions[rows[keep]], positions[indices[keep]]),
+                    axis=1)
+
+
+def draw_network(ax, positions, segments, node_color=NODE_COLOR, cmap=None,
+                 node_size=5, edge_width=0.1, edge_alpha=0.4, nodes=None):
+    """Draws the network on ax, as networkx's draw_networkx_nodes and
+    draw_networkx_edges would, but with all the edges in a single
+    LineCollection of the precomputed segments (see edge_segments) and all
+    the nodes in a single scatter, both rasterized
+
+    node_color is either one colour, or one colour or value per node
+    (mapped through cmap), aligned with positions. With nodes (a boolean
+    mask), only those nodes are drawn. Returns the scatter of the nodes,
+    which fig.colorbar accepts as it is."""
+    if nodes is not None:
+        nodes = np.asarray(nodes, dtype=bool)
+        positions = positions[nodes]
+        if not isinstance(node_color, str):
+            node_color = np.asarray(node_color)[nodes]
+    ax.add_collection(LineCollection(
+        segments, colors="k", linewidths=edge_width, alpha=edge_alpha,
+        zorder=1, rasterized=True))
+    scatter = ax.scatter(positions[:, 0], positions[:, 1], s=node_size,
+                         c=node_color, cmap=cmap, linewidths=0, zorder=2,
+                         rasterized=True)
+    ax.autoscale_view()
+    ax.tick_params(axis="both", which="both", bottom=False, left=False,
+                   labelbottom=False, labelleft=False)
+    return scatter
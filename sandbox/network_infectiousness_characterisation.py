@@ -1,9 +1,10 @@
-import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib as mpl
 
-from scipy import io
-from networkx import algorithms as alg
+from network_loader import load_network, graph_to_csr
+from metric_store import stress_layout
+from network_drawing import edge_segments, draw_network
+from results_store import load_results, align_to_graph
 
 
 OUTPUT_PATH = "./output/"
@@ -12,36 +13,38 @@ NETWORK_NAME = "power"
 
 NODE_SIZE = 5
 EDGE_WIDTH = 0.1
+# Quality of the network layout: "draft", "normal" or "high"
+LAYOUT_QUALITY = "normal"
 
 OUTPUT = "output/"
 DEBUGGING = "debugging/"
 
 # ----------------------------------------------------------------------- #
 # get logged variable for plot debugging
-mdic = io.loadmat(DEBUGGING + "sir_simulation_power_beta65.mat")
-NETWORK_NAME = mdic["NETWORK_NAME"][0]
-M = mdic["M"][0]
+results, metadata = load_results(DEBUGGING + "sir_simulation_power_beta65",
+                                 columns=["M", "node_ids"], mmap=True)
+NETWORK_NAME = metadata["network_name"]
+M = results["M"]
 
 # Read the nework
-G = nx.read_gml(f"data/{NETWORK_NAME}.gml", label="id")
-# G = nx.read_edgelist(
-#     f"data/{NETWORK_NAME}.txt", create_using=nx.Graph(), nodetype=int)
-# Input graph has self loops which is not permitted
-G.remove_edges_from(nx.selfloop_edges(G))
-G = G.subgraph(sorted(nx.connected_components(G), key=len, reverse=True)[0])
+G = load_network(NETWORK_NAME)
+# Model networks may have self loops and disconnected components
+# G.remove_edges_from(nx.selfloop_edges(G))
+# G = G.subgraph(
+#     sorted(nx.connected_components(G), key=len, reverse=True)[0])
+M = align_to_graph(M, G, metadata, results.get("node_ids"))
 
 
 """Spreading potential of each node"""
 fig, ax = plt.subplots(nrows=1, ncols=1)
-colors = list(M/len(G.nodes)*100)
-norm = mpl.colors.Normalize(vmin=min(colors), vmax=max(colors))
-pos = nx.kamada_kawai_layout(G)
-fig.colorbar(mpl.cm.ScalarMappable(norm=norm, cmap=CMAP_STYLE),
-             ax=ax, label='Percentage of network infected')
-nx.draw_networkx_nodes(
-    G, pos, node_size=NODE_SIZE,
-    node_color=colors, cmap=CMAP_STYLE, ax=ax)
-nx.draw_networkx_edges(G, pos, alpha=0.4, ax=ax, width=EDGE_WIDTH)
+colors = M/len(G.nodes)*100
+pos = stress_layout(G, quality=LAYOUT_QUALITY)
+positions = np.array([pos[node] for node in G.nodes])
+segments = edge_segments(*graph_to_csr(G), positions)
+nodes = draw_network(ax, positions, segments, node_color=colors,
+                     cmap=CMAP_STYLE, node_size=NODE_SIZE,
+                     edge_width=EDGE_WIDTH)
+fig.colorbar(nodes, ax=ax, label='Percentage of network infected')
 ax.set_title(f"Spreading potential of each node in the {NETWORK_NAME} network")
 ax.text(
     5.0, 5.0, "SIR model, $\\beta$ = 4%\nColormap reflects the percentage of\
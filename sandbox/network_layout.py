@@ -0,0 +1,114 @@
+import numpy as np
+from scipy.sparse import csgraph
+
+from worker_pool import adjacency_matrix
+
+"""(number of pivots, number of iterations) of each layout quality"""
+QUALITIES = {"draft": (20, 30),
+             "normal": (50, 100),
+             "high": (200, 300)}
+
+
+def pivot_distances(indptr, indices, num_pivots, rng):
+    """Pivot nodes and their (pivots x nodes) shortest path distances
+
+    Pivots are picked max-min: the first one at random, and every next one
+    as the node farthest from all the pivots picked so far, which spreads
+    them over the whole network. Only one breadth first search per pivot is
+    needed, instead of the all pairs distances."""
+    num_nodes = len(indptr) - 1
+    adjacency = adjacency_matrix(indptr, indices)
+    num_pivots = min(num_pivots, num_nodes)
+    pivots = [int(rng.integers(num_nodes))]
+    distances = np.empty((num_pivots, num_nodes))
+    nearest = np.full(num_nodes, np.inf)
+    for k in range(num_pivots):
+        distances[k] = csgraph.shortest_path(
+            adjacency, unweighted=True, indices=pivots[k])
+        nearest = np.minimum(nearest, distances[k])
+        if k + 1 < num_pivots:
+            pivots.append(int(np.argmax(nearest)))
+    # Unreachable nodes are put just beyond the farthest reachable ones
+    finite = np.isfinite(distances)
+    distances[~finite] = distances[finite].max() + 1
+    return np.array(pivots), distances
+
+
+def pivot_mds(distances):
+    """2D positions from the pivot distances, by pivot MDS (Brandes & Pich):
+    classical MDS of the double centred squared distances, with the
+    eigenvectors of the small (pivots x pivots) matrix C^T C"""
+    squared = distances.T ** 2
+    centred = (squared - squared.mean(axis=0) - squared.mean(axis=1)[:, None]
+               + squared.mean()) / -2
+    _, vectors = np.linalg.eigh(centred.T @ centred)
+    return centred @ vectors[:, -2:][:, ::-1]
+
+
+def stress_terms(indptr, indices, pivots, distances):
+    """(node, other node, distance, weight) of every term of the sparse
+    stress of Ortmann, Klimenta & Brandes
+
+    Each edge is a term at distance 1 and weight 1. Each node i is also
+    tied to every pivot p, at their graph distance d, with weight s / d^2,
+    where s is the number of nodes of the region of p (the nodes closer to p
+    than to any other pivot) that are at most d / 2 away from p: p stands
+    for all of them in the stress of i."""
+    num_nodes = len(indptr) - 1
+    rows = np.repeat(np.arange(num_nodes), np.diff(indptr))
+    region = np.argmin(distances, axis=0)
+
+    pivot_nodes, pivot_cols, pivot_weights = [], [], []
+    for k, pivot in enumerate(pivots):
+        in_region = np.sort(distances[k, region == k])
+        represented = np.searchsorted(in_region, distances[k] / 2,
+                                      side="right")
+        others = np.flatnonzero(distances[k] > 0)
+        pivot_nodes.append(others)
+        pivot_cols.append(np.full(len(others), pivot))
+        pivot_weights.append(represented[others] / distances[k, others] ** 2)
+
+    nodes = np.concatenate([rows] + pivot_nodes)
+    others = np.concatenate([indices] + pivot_cols)
+    lengths = np.concatenate(
+        [np.ones(len(indices))] + [distances[k, tied] for k, tied in
+                                   enumerate(pivot_nodes)])
+    weights = np.concatenate([np.ones(len(indices))] + pivot_weights)
+    return nodes, others, lengths, weights
+
+
+def stress_layout(indptr, indices, quality="normal", seed=0):
+    """2D layout of the network by sparse stress majorization
+
+    Graph distances are only computed from a few pivots (see QUALITIES),
+    so memory is O(pivots x N) instead of the O(N^2) of Kamada-Kawai. The
+    layout starts from pivot MDS and is then improved by stress majorization
+    of the sparse stress (see stress_terms), all the nodes being moved
+    together at each iteration. The result only depends on the network,
+    quality and seed. Returns a (nodes x 2) array of positions in [-1, 1],
+    aligned with the rows of the CSR adjacency."""
+    num_nodes = len(indptr) - 1
+    if num_nodes < 3:
+        return np.zeros((num_nodes, 2))
+    num_pivots, num_iterations = QUALITIES[quality]
+    rng = np.random.default_rng(seed)
+    pivots, distances = pivot_distances(indptr, indices, num_pivots, rng)
+    positions = pivot_mds(distances)
+    # Scale the MDS solution to graph distances, and break any ties
+    positions *= distances.mean() / max(np.abs(positions).mean(), 1e-12)
+    positions += rng.normal(scale=1e-3, size=positions.shape)
+
+    nodes, others, lengths, weights = stress_terms(
+        indptr, indices, pivots, distances)
+    total_weights = np.bincount(nodes, weights, minlength=num_nodes)
+    for _ in range(num_iterations):
+        difference = positions[nodes] - positions[others]
+        norm = np.maximum(np.linalg.norm(difference, axis=1), 1e-9)
+        targets = positions[others] + (lengths / norm)[:, None] * difference
+        positions = np.stack(
+            [np.bincount(nodes, weights * targets[:, axis],
+                         minlength=num_nodes) for axis in range(2)],
+            axis=1) / total_weights[:, None]
+
+    positions -= positions.mean(axis=0)
+    return positions / np.abs(positions).max()
@@ -0,0 +1,153 @@
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+
+import networkx as nx
+
+DATA = "data/"
+CACHE = "cache/"
+
+
+def save_atomically(path, save, *args, **kwargs):
+    """save(file, *args, **kwargs) (np.save, np.savez, ...) to path, through
+    a temporary file of the same directory moved onto path once complete, so
+    that an interrupted run never leaves a truncated file there"""
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".",
+                                     suffix=".tmp", delete=False) as file:
+        try:
+            save(file, *args, **kwargs)
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    os.replace(file.name, path)
+
+
+def graph_to_csr(G):
+    """Compact CSR adjacency (indptr, indices) of the network G
+
+    Row i of the adjacency corresponds to the i-th node of list(G.nodes), so
+    that a node index in the returned arrays lines up with enumerate(G.nodes)
+    (and hence with the M vector of the simulation scripts)."""
+    node_index = {node: i for i, node in enumerate(G.nodes)}
+    degrees = np.fromiter((d for _, d in G.degree()), dtype=np.int64,
+                          count=len(node_index))
+    indptr = np.zeros(len(node_index) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = np.fromiter(
+        (node_index[v] for u in G.nodes for v in G.adj[u]),
+        dtype=np.int64, count=indptr[-1])
+    return indptr, indices
+
+
+def csr_to_graph(indptr, indices, node_ids):
+    """networkx Graph with the given CSR adjacency and node ids
+
+    Nodes are added in the order of node_ids, so G.nodes follows the rows of
+    the adjacency as it did in the graph the arrays were made from."""
+    G = nx.Graph()
+    G.add_nodes_from(node_ids.tolist())
+    rows = np.repeat(np.arange(len(node_ids)), np.diff(indptr))
+    upper = rows < indices
+    G.add_edges_from(zip(node_ids[rows[upper]].tolist(),
+                         node_ids[indices[upper]].tolist()))
+    return G
+
+
+def network_names():
+    """Names of the networks of data/, i.e. of its files without extension"""
+    return sorted({os.path.splitext(name)[0] for name in os.listdir(DATA)})
+
+
+def source_path(network_name):
+    """Path of the data/ file (.gml or .txt edge list) of a network"""
+    for extension in [".gml", ".txt"]:
+        path = DATA + network_name + extension
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(
+        f"No {DATA}{network_name}.gml or {DATA}{network_name}.txt file.")
+
+
+def clean_network(G):
+    """G without self loops, and reduced to its largest connected component,
+    the same way as all the scripts of the project do"""
+    # Input graph has self loops which is not permitted
+    G.remove_edges_from(nx.selfloop_edges(G))
+    return G.subgraph(
+        sorted(nx.connected_components(G), key=len, reverse=True)[0])
+
+
+def read_network(network_name):
+    """Parses and cleans a network of data/ (see clean_network), without
+    using the cache"""
+    path = source_path(network_name)
+    if path.endswith(".gml"):
+        G = nx.read_gml(path, label="id")
+    else:
+        G = nx.read_edgelist(path, create_using=nx.Graph(), nodetype=int)
+    return clean_network(G)
+
+
+def file_hash(path):
+    """SHA-256 of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_csr_cache(cache_path, indptr, indices, node_ids, stat, sha256):
+    """Writes the cache of load_network_csr, with the modification time and
+    size (stat) and SHA-256 of the source file it was made from"""
+    os.makedirs(CACHE, exist_ok=True)
+    save_atomically(cache_path, np.savez, indptr=indptr, indices=indices,
+                    node_ids=node_ids, mtime_ns=stat.st_mtime_ns,
+                    size=stat.st_size, sha256=sha256)
+
+
+def load_network_csr(network_name):
+    """(indptr, indices, node_ids) of a cleaned network of data/
+
+    The cleaned network is cached in cache/<network_name>.npz as its CSR
+    adjacency plus the id of the node of each row. The cache is valid as
+    long as the source file has the same modification time and size as when
+    it was written, or otherwise still has the same contents (SHA-256), in
+    which case its new modification time and size are recorded; if not, the
+    source is parsed again and the cache rewritten."""
+    path = source_path(network_name)
+    cache_path = CACHE + network_name + ".npz"
+    stat = os.stat(path)
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            cached = dict(cached)
+        csr = cached["indptr"], cached["indices"], cached["node_ids"]
+        if (cached["mtime_ns"], cached["size"]) == (stat.st_mtime_ns,
+                                                    stat.st_size):
+            return csr
+        sha256 = file_hash(path)
+        if cached["sha256"] == sha256:
+            # Touched or checked out again, but unchanged: the next loads
+            # can skip hashing the file
+            _write_csr_cache(cache_path, *csr, stat, sha256)
+            return csr
+    else:
+        sha256 = file_hash(path)
+
+    G = read_network(network_name)
+    indptr, indices = graph_to_csr(G)
+    node_ids = np.array(list(G.nodes))
+    _write_csr_cache(cache_path, indptr, indices, node_ids, stat, sha256)
+    return indptr, indices, node_ids
+
+
+def load_network(network_name):
+    """Cleaned network of data/ as a networkx Graph, see load_network_csr
+
+    Only the structure of the network is cached: node attributes of the
+    source file (e.g. GML labels) are not kept."""
+    return csr_to_graph(*load_network_csr(network_name))
@@ -0,0 +1,186 @@
+import os
+
+import numpy as np
+from scipy import stats
+
+import worker_pool
+from worker_pool import adjacency_matrix, init_adjacency, process_pool
+
+
+def coreness(indptr, indices):
+    """Coreness k_s of every node, from the CSR adjacency of the network
+
+    Bucket-based core decomposition (Batagelj & Zaversnik): nodes are kept
+    sorted by their current degree in a single array, split in one bucket per
+    degree, and removed in order of increasing degree. Removing a node only
+    moves each of its higher-degree neighbours one bucket down, so the whole
+    decomposition takes O(N + E). The returned array is aligned with the rows
+    of the adjacency, i.e. with the order of G.nodes."""
+    degrees = np.diff(indptr)
+    num_nodes = len(degrees)
+    if num_nodes == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Nodes sorted by degree, and where each degree bucket starts
+    order = np.argsort(degrees, kind="stable")
+    bucket_start = np.searchsorted(degrees[order],
+                                   np.arange(degrees.max() + 1)).tolist()
+    position = np.empty(num_nodes, dtype=np.int64)
+    position[order] = np.arange(num_nodes)
+
+    # Plain lists are much faster than arrays for element-wise updates
+    degree = degrees.tolist()
+    order = order.tolist()
+    position = position.tolist()
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+
+    for i in range(num_nodes):
+        v = order[i]
+        for u in indices[indptr[v]:indptr[v + 1]]:
+            if degree[u] > degree[v]:
+                # Swap u with the first node of its bucket, then shrink the
+                # bucket so that u falls into the one below
+                du = degree[u]
+                pu = position[u]
+                pw = bucket_start[du]
+                w = order[pw]
+                if u != w:
+                    order[pu], order[pw] = w, u
+                    position[u], position[w] = pw, pu
+                bucket_start[du] += 1
+                degree[u] -= 1
+
+    return np.array(degree, dtype=np.int64)
+
+
+def source_dependencies(adjacency, sources):
+    """Brandes dependencies delta_s(v) of every node v on each source s
+
+    All the sources are processed together, one column each: the breadth
+    first searches advance level by level with a sparse matrix product that
+    also counts the shortest paths sigma, and the dependencies are then
+    accumulated back from the deepest level, as the sum over the successors w
+    of v of sigma(v) / sigma(w) * (1 + delta_s(w)).
+    Returns a (nodes x sources) array; the dependency of a source on itself
+    is 0."""
+    num_nodes = adjacency.shape[0]
+    columns = np.arange(len(sources))
+    sigma = np.zeros((num_nodes, len(sources)))
+    sigma[sources, columns] = 1
+    distance = np.full((num_nodes, len(sources)), -1, dtype=np.int32)
+    distance[sources, columns] = 0
+
+    # Forward pass: shortest path counts, one BFS level at a time
+    frontier = sigma.copy()
+    depth = 0
+    while frontier.any():
+        paths = adjacency @ frontier
+        reached = (paths > 0) & (distance == -1)
+        depth += 1
+        distance[reached] = depth
+        frontier = np.where(reached, paths, 0)
+        sigma += frontier
+
+    # Backward pass: dependencies, from the deepest level up to the sources
+    delta = np.zeros((num_nodes, len(sources)))
+    for level in range(depth - 1, 0, -1):
+        successors = distance == level + 1
+        coefficient = np.zeros_like(delta)
+        coefficient[successors] = (1 + delta[successors]) / sigma[successors]
+        at_level = distance == level
+        delta[at_level] = (sigma * (adjacency @ coefficient))[at_level]
+    return delta
+
+
+def chunk_dependencies(sources, batch_size):
+    """Sum over a chunk of sources of their dependencies, in a worker"""
+    adjacency = worker_pool.worker_adjacency
+    total = np.zeros(adjacency.shape[0])
+    for start in range(0, len(sources), batch_size):
+        total += source_dependencies(
+            adjacency, sources[start:start + batch_size]).sum(axis=1)
+    return total
+
+
+def betweenness(indptr, indices, batch_size=64, num_workers=1,
+                chunk_size=512):
+    """Exact (normalised) betweenness centrality C_B of every node
+
+    Same values as networkx's betweenness_centrality for undirected graphs,
+    aligned with the rows of the CSR adjacency. The source nodes are split in
+    chunks of chunk_size whose dependencies are summed by num_workers
+    processes (os.cpu_count() if None); each worker receives the network
+    only once. Partial sums are added in chunk order, so C_B does not depend
+    on the number of workers."""
+    num_nodes = len(indptr) - 1
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    chunks = [np.arange(start, min(start + chunk_size, num_nodes))
+              for start in range(0, num_nodes, chunk_size)]
+
+    if num_workers == 1:
+        init_adjacency(indptr, indices, np.float64)
+        partials = [chunk_dependencies(chunk, batch_size) for chunk in chunks]
+    else:
+        with process_pool(num_workers, init_adjacency,
+                          (indptr, indices, np.float64)) as executor:
+            partials = list(executor.map(
+                chunk_dependencies, chunks, [batch_size] * len(chunks)))
+
+    total = np.zeros(num_nodes)
+    for partial in partials:
+        total += partial
+    if num_nodes <= 2:
+        return total
+    return total / ((num_nodes - 1) * (num_nodes - 2))
+
+
+def sampled_betweenness(indptr, indices, epsilon=None, confidence=0.95,
+                        num_sources=None, batch_size=64, seed=None,
+                        relative=False):
+    """Approximate betweenness centrality C_B from a sample of source nodes
+
+    Each source s sampled (without replacement) gives an unbiased estimate
+    n delta_s(v) / ((n - 1)(n - 2)) of the normalised C_B of every node v.
+    With num_sources, exactly that many pivots are used. Otherwise sources
+    are added batch_size at a time until, for every node, the half width of
+    the normal confidence interval (at the given confidence level) of its
+    average estimate is at most epsilon, or with relative=True at most
+    epsilon times the estimate itself. An absolute bound leaves the small
+    C_B, which log and quantile bins spread over most of the axis, with
+    large relative errors; the relative one keeps every node within about
+    epsilon of its C_B (in log scale) but needs more sources, as the nodes
+    with a small C_B are the ones few sources contribute to. When all the
+    nodes end up being used as sources the result is exact.
+
+    Returns the estimated C_B and the number of sources used."""
+    adjacency = adjacency_matrix(indptr, indices, np.float64)
+    num_nodes = adjacency.shape[0]
+    if num_nodes <= 2:
+        return np.zeros(num_nodes), num_nodes
+    order = np.random.default_rng(seed).permutation(num_nodes)
+    if num_sources is not None:
+        order = order[:num_sources]
+    scale = num_nodes / ((num_nodes - 1) * (num_nodes - 2))
+    z = stats.norm.ppf(1 - (1 - confidence) / 2)
+
+    total = np.zeros(num_nodes)
+    total_squares = np.zeros(num_nodes)
+    used = 0
+    for start in range(0, len(order), batch_size):
+        estimates = scale * source_dependencies(
+            adjacency, order[start:start + batch_size])
+        total += estimates.sum(axis=1)
+        total_squares += (estimates ** 2).sum(axis=1)
+        used += estimates.shape[1]
+        if epsilon is not None and num_sources is None and used > 1:
+            variance = (total_squares - total ** 2 / used) / (used - 1)
+            # Finite population correction, as sources are not replaced
+            variance *= (num_nodes - used) / num_nodes
+            half_width = z * np.sqrt(np.maximum(variance, 0) / used)
+            tolerance = epsilon * total / used if relative else epsilon
+            if np.all(half_width <= tolerance):
+                break
+
+    return total / used, used
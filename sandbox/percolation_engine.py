@@ -0,0 +1,117 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from spreading_sweep import (
+    standard_error, confidence_interval, size_bin_edges, size_histograms)
+
+
+def iter_cluster_sizes(indptr, indices, betas, rngs):
+    """Size of the cluster of every node in bond percolation samples, one
+    beta at a time
+
+    Sample j draws one uniform threshold per edge from rngs[j], and for each
+    occupation probability of betas keeps the edges whose threshold is below
+    it. The samples of all the betas are thus coupled: clusters only grow
+    with beta, and the M(beta) curves of every node are smooth. For a given
+    beta, all the samples are stacked as disjoint copies of the network in a
+    single sparse graph, whose connected components are found in one pass.
+    Yields a (nodes x samples) array for every beta, in order."""
+    num_nodes = len(indptr) - 1
+    rows = np.repeat(np.arange(num_nodes), np.diff(indptr))
+    upper = rows < indices
+    rows, cols = rows[upper], indices[upper]
+    thresholds = [rng.random(len(rows)) for rng in rngs]
+    size = num_nodes * len(rngs)
+
+    for beta in betas:
+        kept = [np.flatnonzero(sample < beta) for sample in thresholds]
+        offsets = np.repeat(np.arange(len(rngs)) * num_nodes,
+                            [len(edges) for edges in kept])
+        kept = np.concatenate([np.zeros(0, dtype=np.int64)] + kept)
+        graph = sparse.csr_matrix(
+            (np.ones(len(kept), dtype=np.int8),
+             (rows[kept] + offsets, cols[kept] + offsets)),
+            shape=(size, size))
+        _, labels = csgraph.connected_components(graph, directed=False)
+        yield np.bincount(labels)[labels].reshape(len(rngs), num_nodes).T
+
+
+def cluster_sizes(indptr, indices, betas, rngs):
+    """(nodes x samples x betas) array of the cluster sizes of every node,
+    see iter_cluster_sizes"""
+    return np.stack(list(iter_cluster_sizes(indptr, indices, betas, rngs)),
+                    axis=-1)
+
+
+def sample_rngs(master_seed, start, stop):
+    """RNG streams of samples start to stop - 1, seeded with
+    (master_seed, sample) so that they do not depend on the batching"""
+    return [np.random.default_rng([master_seed, sample])
+            for sample in range(start, stop)]
+
+
+def beta_sweep(indptr, indices, betas, num_samples, master_seed,
+               samples_per_batch=20, confidence=0.95, num_size_bins=20,
+               size_binning="log"):
+    """Average final size M[i, k] of an SIR outbreak started at every node i,
+    for gamma = 1 and every infection probability betas[k]
+
+    When infected nodes recover after one step, an outbreak reaches exactly
+    the nodes connected to its starting node by edges that transmitted the
+    infection, each of which does so with probability beta independently of
+    the rest. So one bond percolation sample gives a realisation for every
+    starting node at once: the final size is the size of its cluster. There
+    is no iteration budget, i.e. this is the limit of run_sweep for a large
+    enough num_iterations (see report_durations).
+
+    The same samples are used for all the betas (see cluster_sizes). They
+    are drawn samples_per_batch at a time, sample j from a stream seeded
+    with (master_seed, j), so M does not depend on samples_per_batch nor on
+    which other betas are swept. Returns a dict of (nodes x betas) arrays M,
+    M_SE and M_CI (nodes x betas x 2), NUM_REALISATIONS (num_samples for
+    every node), the (nodes x betas x bins) histograms of final sizes
+    SIZE_HIST and SIZE_HIST_SUMS over the bins SIZE_BIN_EDGES (see
+    run_sweep), and the BETAS."""
+    betas = np.asarray(betas, dtype=float)
+    num_nodes = len(indptr) - 1
+    size_edges = size_bin_edges(num_nodes, num_size_bins, size_binning)
+    sums = np.zeros((num_nodes, len(betas)))
+    sums_squares = np.zeros((num_nodes, len(betas)))
+    histograms = np.zeros((num_nodes, len(betas), len(size_edges) - 1),
+                          dtype=np.int64)
+    histogram_sums = np.zeros(histograms.shape)
+    for start in range(0, num_samples, samples_per_batch):
+        rngs = sample_rngs(master_seed, start,
+                           min(start + samples_per_batch, num_samples))
+        sizes = cluster_sizes(indptr, indices, betas, rngs).astype(float)
+        sums += sizes.sum(axis=1)
+        sums_squares += (sizes ** 2).sum(axis=1)
+        for k in range(len(betas)):
+            counts, size_sums = size_histograms(sizes[:, :, k], size_edges)
+            histograms[:, k] += counts
+            histogram_sums[:, k] += size_sums
+
+    M = sums / num_samples
+    M_SE = standard_error(sums, sums_squares, num_samples)
+    return {"M": M, "M_SE": M_SE,
+            "M_CI": confidence_interval(M, M_SE, confidence),
+            "NUM_REALISATIONS": np.full(num_nodes, num_samples,
+                                        dtype=np.int64),
+            "SIZE_HIST": histograms, "SIZE_HIST_SUMS": histogram_sums,
+            "SIZE_BIN_EDGES": size_edges, "BETAS": betas}
+
+
+def percolation_sweep(indptr, indices, beta, num_samples, master_seed,
+                      samples_per_batch=20, confidence=0.95,
+                      num_size_bins=20, size_binning="log"):
+    """M[i] for a single beta, with the same per-node arrays as run_sweep:
+    M, M_SE, M_CI, NUM_REALISATIONS and the SIZE_HIST and SIZE_HIST_SUMS
+    histograms over SIZE_BIN_EDGES (see beta_sweep)"""
+    results = beta_sweep(indptr, indices, [beta], num_samples, master_seed,
+                         samples_per_batch, confidence, num_size_bins,
+                         size_binning)
+    del results["BETAS"]
+    for field in ["M", "M_SE", "M_CI", "SIZE_HIST", "SIZE_HIST_SUMS"]:
+        results[field] = results[field][:, 0]
+    return results
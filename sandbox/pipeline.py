@@ -0,0 +1,264 @@
+import os
+import json
+import hashlib
+import argparse
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+import networkx as nx
+
+from network_loader import (
+    CACHE, source_path, file_hash, load_network_csr, clean_network,
+    graph_to_csr, csr_to_graph, save_atomically)
+from metric_store import betweenness_centrality, stress_layout, coreness
+from network_drawing import edge_segments
+from percolation_engine import percolation_sweep
+from spreading_sweep import run_sweep
+from spreading_analysis import analysis_grids
+from figure_renderer import render_figures
+from render_figures import (
+    OUTPUT, NODE_SIZE, EDGE_WIDTH, shell_drawing, metric_jobs,
+    spreading_jobs)
+from instrumentation import log_event, stage
+from worker_pool import process_pool
+
+"""Runs the whole analysis (load -> metrics -> sweep -> aggregate -> plot)
+for every network and beta of a JSON config, recomputing only the tasks
+whose inputs changed since the last run"""
+PIPELINE = CACHE + "pipeline/"
+"""Part of every task key, to be bumped whenever the outputs of a stage
+change, so that those stored by older code are recomputed"""
+PIPELINE_VERSION = 4
+
+"""One stage of the pipeline on one network (and beta, or None for the
+stages that do not depend on it); dependencies are the names of the tasks
+whose outputs are passed to the stage, in order, before its params"""
+Task = namedtuple("Task", "name stage network beta params dependencies")
+
+
+def load_stage(name, sha256=None, generator=None, generator_params=None):
+    """CSR adjacency and node ids of a network of data/ (sha256 is only
+    there to tell versions of its source file apart), or of a networkx
+    generator called with generator_params and cleaned like the data"""
+    if generator is None:
+        indptr, indices, node_ids = load_network_csr(name)
+    else:
+        G = clean_network(getattr(nx, generator)(**generator_params))
+        indptr, indices = graph_to_csr(G)
+        node_ids = np.array(list(G.nodes))
+    return {"indptr": indptr, "indices": indices, "node_ids": node_ids}
+
+
+def metrics_stage(graph, cb_epsilon=None, cb_relative=True,
+                  layout_quality="normal"):
+    """Per-node coreness, degree, betweenness centrality and layout"""
+    G = csr_to_graph(graph["indptr"], graph["indices"], graph["node_ids"])
+    centrality = betweenness_centrality(
+        G, epsilon=cb_epsilon, relative=cb_relative, num_workers=1)
+    pos = stress_layout(G, quality=layout_quality)
+    return {"coreness": coreness(G), "degree": np.diff(graph["indptr"]),
+            "centrality": np.array([centrality[node] for node in G.nodes]),
+            "positions": np.array([pos[node] for node in G.nodes])}
+
+
+def sweep_stage(graph, beta, method="percolation", gamma=1.0,
+                num_iterations=200, num_realisations=50, master_seed=30):
+    """M of every starting node for one beta, by bond percolation or by
+    simulating the SIR model (method "simulation"), with the histograms of
+    final sizes it is the mean of (see run_sweep)"""
+    if method == "percolation":
+        if gamma != 1.0:
+            raise ValueError("Bond percolation only gives the SIR outbreak "
+                             f"sizes for gamma = 1, not {gamma}.")
+        results = percolation_sweep(graph["indptr"], graph["indices"], beta,
+                                    num_realisations, master_seed)
+    elif method == "simulation":
+        results = run_sweep(graph["indptr"], graph["indices"], beta, gamma,
+                            num_iterations, num_realisations, master_seed,
+                            num_workers=1)
+    else:
+        raise ValueError(f"Unknown sweep method {method!r}, expected "
+                         f"'percolation' or 'simulation'.")
+    return {field: results[field]
+            for field in ["M", "M_SE", "NUM_REALISATIONS", "SIZE_HIST",
+                          "SIZE_HIST_SUMS", "SIZE_BIN_EDGES"]}
+
+
+def aggregate_stage(metrics, sweep, num_cb_bins=25, cb_binning="log"):
+    """The M(k_s, k) and M(k_s, C_B) grids, see analysis_grids"""
+    return analysis_grids(sweep["M"], metrics["coreness"], metrics["degree"],
+                          metrics["centrality"], num_cb_bins, cb_binning)
+
+
+def drawing(graph, metrics):
+    """Positions, edge segments and style of the network for draw_network"""
+    return {"positions": metrics["positions"],
+            "segments": edge_segments(graph["indptr"], graph["indices"],
+                                      metrics["positions"]),
+            "node_size": NODE_SIZE, "edge_width": EDGE_WIDTH}
+
+
+def metric_figures_stage(graph, metrics, network):
+    """Per-node metric figures of the network, in output/<network>/"""
+    render_figures(metric_jobs(
+        OUTPUT + network + "/", network, drawing(graph, metrics),
+        metrics["coreness"], metrics["degree"], metrics["centrality"],
+        shell_drawing(graph["indptr"], graph["indices"], metrics["positions"],
+                      metrics["coreness"])),
+        num_workers=1)
+
+
+def spreading_figures_stage(graph, metrics, sweep, grids, network, beta):
+    """Spreading figures of the network for one beta, in
+    output/<network>/pipeline_beta<beta>_*.png"""
+    render_figures(spreading_jobs(
+        OUTPUT + network + f"/pipeline_beta{beta:g}_", network,
+        drawing(graph, metrics), sweep["M"], grids), num_workers=1)
+
+
+"""Stage functions by name; the outputs of the figure stages are the PNGs,
+which render_figures itself keeps up to date, so they are never cached"""
+STAGES = {"load": load_stage,
+          "metrics": metrics_stage,
+          "sweep": sweep_stage,
+          "aggregate": aggregate_stage,
+          "metric_figures": metric_figures_stage,
+          "spreading_figures": spreading_figures_stage}
+UNCACHED_STAGES = {"metric_figures", "spreading_figures"}
+
+
+def build_tasks(config):
+    """Tasks of the config, in an order where dependencies come first
+
+    The config has a list of networks, each either {"name": <network of
+    data/>} or {"name": ..., "generator": <networkx generator function>,
+    "params": {...}}, optionally with its own "betas"; the default "betas";
+    and the parameters of the "metrics", "sweep" and "aggregate" stages."""
+    tasks = []
+    for network in config["networks"]:
+        name = network["name"]
+        if "generator" in network:
+            load_params = {"name": name, "generator": network["generator"],
+                           "generator_params": network.get("params", {})}
+        else:
+            load_params = {"name": name,
+                           "sha256": file_hash(source_path(name))}
+        tasks += [
+            Task(f"{name}/load", "load", name, None, load_params, ()),
+            Task(f"{name}/metrics", "metrics", name, None,
+                 config.get("metrics", {}), (f"{name}/load",)),
+            Task(f"{name}/metric_figures", "metric_figures", name, None,
+                 {"network": name}, (f"{name}/load", f"{name}/metrics"))]
+        for beta in network.get("betas", config["betas"]):
+            at_beta = f"{name}/beta{beta:g}"
+            tasks += [
+                Task(f"{at_beta}/sweep", "sweep", name, beta,
+                     dict(config.get("sweep", {}), beta=beta),
+                     (f"{name}/load",)),
+                Task(f"{at_beta}/aggregate", "aggregate", name, beta,
+                     config.get("aggregate", {}),
+                     (f"{name}/metrics", f"{at_beta}/sweep")),
+                Task(f"{at_beta}/spreading_figures", "spreading_figures",
+                     name, beta, {"network": name, "beta": beta},
+                     (f"{name}/load", f"{name}/metrics", f"{at_beta}/sweep",
+                      f"{at_beta}/aggregate"))]
+    return tasks
+
+
+def task_keys(tasks):
+    """Content key of every task: a hash of the PIPELINE_VERSION, its stage,
+    its params and the keys of its dependencies, so that a change anywhere
+    upstream also changes the keys of all the tasks downstream"""
+    keys = {}
+    for task in tasks:
+        keys[task.name] = hashlib.sha256(json.dumps(
+            [PIPELINE_VERSION, task.stage, task.params,
+             [keys[name] for name in task.dependencies]],
+            sort_keys=True).encode()).hexdigest()
+    return keys
+
+
+def output_path(task, key):
+    """Where the output of a task is stored, None for the uncached stages"""
+    if task.stage in UNCACHED_STAGES:
+        return None
+    return PIPELINE + f"{task.name}_{key[:16]}.npz"
+
+
+def run_task(stage_name, params, dependency_paths, path):
+    """Runs one stage, with the outputs of its dependencies read from
+    dependency_paths, and saves its output to path (unless None)"""
+    inputs = []
+    for dependency_path in dependency_paths:
+        with np.load(dependency_path) as output:
+            inputs.append(dict(output))
+    result = STAGES[stage_name](*inputs, **params)
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_atomically(path, np.savez, **result)
+
+
+def run_pipeline(tasks, num_workers=None, dry_run=False):
+    """Runs the tasks whose output is not stored yet, each as soon as all of
+    its dependencies are done, num_workers (os.cpu_count() if None) at a
+    time. The figure stages always run, but only redraw the figures whose
+    inputs changed. With dry_run, only reports what would be run."""
+    keys = task_keys(tasks)
+    paths = {task.name: output_path(task, keys[task.name]) for task in tasks}
+    done = {name for name, path in paths.items()
+            if path is not None and os.path.exists(path)}
+    pending = [task for task in tasks if task.name not in done]
+    log_event("pipeline", f"{len(done)} tasks up to date, {len(pending)} to "
+              f"run (figure stages included).", up_to_date=len(done),
+              to_run=len(pending))
+    if dry_run:
+        for task in pending:
+            print(task.name)
+        return
+    if num_workers is None:
+        num_workers = os.cpu_count()
+
+    def arguments(task):
+        return (task.stage, task.params,
+                [paths[name] for name in task.dependencies], paths[task.name])
+
+    if num_workers == 1:
+        for task in pending:
+            with stage(task.name, network=task.network, beta=task.beta):
+                run_task(*arguments(task))
+        return
+
+    running = {}
+    with process_pool(num_workers) as executor:
+        while pending or running:
+            for task in [task for task in pending
+                         if done.issuperset(task.dependencies)]:
+                pending.remove(task)
+                running[executor.submit(run_task, *arguments(task))] = task
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                future.result()
+                done.add(task.name)
+                log_event("task", f"Task {task.name} done.", task=task.name,
+                          network=task.network, beta=task.beta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Incremental analysis of every network and beta of a "
+                    "config")
+    parser.add_argument("config", nargs="?", default="pipeline.json",
+                        help="JSON config (default: pipeline.json)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="tasks run at the same time (default: one per "
+                             "CPU core)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only list the tasks that would be run")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    with stage("pipeline", config=args.config):
+        run_pipeline(build_tasks(config), args.workers, args.dry_run)
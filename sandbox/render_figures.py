@@ -0,0 +1,199 @@
+import os
+import glob
+import argparse
+
+import numpy as np
+from scipy.sparse import csgraph
+
+from network_loader import network_names, load_network, graph_to_csr
+from metric_store import betweenness_centrality, stress_layout, coreness
+from network_drawing import edge_segments
+from spreading_analysis import analysis_grids, select_beta
+from figure_renderer import render_figures
+from results_store import load_results, align_to_graph
+from instrumentation import stage
+from worker_pool import adjacency_matrix
+
+"""Renders the per-node metric figures of every network of data/, and the
+spreading figures of every simulation of it in debugging/, into
+output/<network>/, with a pool of workers. Figures whose inputs did not
+change since their PNG was written are skipped."""
+OUTPUT = "output/"
+DEBUGGING = "debugging/"
+
+CMAP_STYLE = "winter"
+M_CMAP_STYLE = "jet"
+NODE_SIZE = 5
+EDGE_WIDTH = 0.1
+# Quality of the network layout: "draft", "normal" or "high"
+LAYOUT_QUALITY = "normal"
+# Target error of the sampled betweenness centrality (None: exact C_B),
+# relative to each node's C_B if CB_RELATIVE. Log and quantile C_B bins
+# need the relative error, at most 0.2 to keep the bins of nearly all the
+# nodes (see betweenness_approximation_check.py), which takes almost every
+# node as a source: sampling only pays off with linear bins
+CB_EPSILON = None
+CB_RELATIVE = True
+# Binning of the betweenness centrality C_B axis of the heatmaps
+CB_BINNING = "log"  # "linear", "log" or "quantile"
+NUM_CB_BINS = 25
+
+
+def simulations(network_name):
+    """(tag, M, metadata, node ids) of every simulation of the network in
+    debugging/: one per sir_simulation_<network>[_<tag>] results file (.npz,
+    or .mat of the previous format), and one per beta of
+    sir_beta_sweep_<network> (see results_store)"""
+    stems = sorted({os.path.splitext(path)[0] for path in glob.glob(
+        DEBUGGING + f"sir_simulation_{network_name}*")
+        if path.endswith((".npz", ".mat"))})
+    for stem in stems:
+        tag = os.path.basename(stem)[len(f"sir_simulation_{network_name}"):]
+        if tag and not tag.startswith("_"):
+            continue  # another network whose name starts the same
+        results, metadata = load_results(stem, columns=["M", "node_ids"],
+                                         mmap=True)
+        yield (tag.lstrip("_"), results["M"], metadata,
+               results.get("node_ids"))
+    stem = DEBUGGING + f"sir_beta_sweep_{network_name}"
+    if os.path.exists(stem + ".npz") or os.path.exists(stem + ".mat"):
+        results, metadata = load_results(
+            stem, columns=["M", "BETAS", "node_ids"], mmap=True)
+        for beta in results["BETAS"].ravel():
+            yield (f"sweep_beta{beta:g}", select_beta(results, beta),
+                   metadata, results.get("node_ids"))
+
+
+def shell_drawing(indptr, indices, positions, corenesses):
+    """The inner shell of a network (the nodes of highest coreness, as a
+    boolean mask), its largest connected component and the segments of the
+    edges of that component, see network_and_shell_figure"""
+    in_shell = corenesses == corenesses.max()
+    shell = np.flatnonzero(in_shell)
+    adjacency = adjacency_matrix(indptr, indices, np.int8)
+    _, labels = csgraph.connected_components(
+        adjacency[shell][:, shell], directed=False)
+    component = np.zeros(len(corenesses), dtype=bool)
+    component[shell[labels == np.argmax(np.bincount(labels))]] = True
+    return {"in_shell": in_shell, "component": component,
+            "component_segments": edge_segments(indptr, indices, positions,
+                                                nodes=component)}
+
+
+def metric_jobs(directory, network_name, drawing, corenesses, degrees,
+                centralities, shell):
+    """(kind, path, inputs) of the per-node metric figures of a network;
+    drawing holds the positions, segments and style of draw_network, and
+    shell the inner shell of the network (see shell_drawing)"""
+    metrics = [(corenesses, "Coreness ($k_S$)", "coreness"),
+               (degrees, "Degree ($k$)", "degree"),
+               (centralities, "Betweenness Centrality ($C_B$)",
+                "centrality")]
+    jobs = [("node_metrics",
+             directory + f"node_{name}_characterisation_{network_name}.png",
+             dict(drawing, values=[values], labels=[label],
+                  titles=[f"{label} of each node"], cmap=CMAP_STYLE))
+            for values, label, name in metrics]
+    jobs.append((
+        "node_metrics",
+        directory + f"centrality_degree_coreness_{network_name}.png",
+        dict(drawing, values=[values for values, _, _ in metrics],
+             labels=[label for _, label, _ in metrics],
+             titles=[f"{label} of each node" for _, label, _ in metrics],
+             cmap=CMAP_STYLE)))
+    jobs.append((
+        "network_characterisation",
+        directory + f"network_characterisation_{network_name}.png",
+        dict(drawing, degrees=degrees, centralities=centralities,
+             corenesses=corenesses, network_name=network_name)))
+    jobs.append((
+        "network_and_shell",
+        directory + f"network_and_outer_shell_{network_name}.png",
+        dict(drawing, **shell, network_name=network_name)))
+    return jobs
+
+
+def spreading_jobs(prefix, network_name, drawing, M, grids):
+    """(kind, path, inputs) of the spreading figures of one simulation of a
+    network (paths starting with prefix); grids is the analysis_grids of
+    its M"""
+    num_nodes = len(M)
+    return [
+        ("ks_vs_k",
+         prefix + f"ks_vs_k_spreading_prediction_{network_name}.png",
+         {"grid": grids["ks_vs_k"] / num_nodes * 100,
+          "unique_coreness": grids["unique_coreness"],
+          "unique_degrees": grids["unique_degrees"], "cmap": M_CMAP_STYLE}),
+        ("ks_vs_cb",
+         prefix + f"ks_vs_cb_spreading_prediction_{network_name}.png",
+         {"grid": grids["ks_vs_cb"] / num_nodes * 100,
+          "unique_coreness": grids["unique_coreness"],
+          "cb_edges": grids["cb_edges"],
+          "log_scale": CB_BINNING == "log", "cmap": M_CMAP_STYLE}),
+        ("k_vs_cb",
+         prefix + f"k_vs_cb_spreading_prediction_{network_name}.png",
+         {"grid": grids["k_vs_cb"] / num_nodes * 100,
+          "unique_degrees": grids["unique_degrees"],
+          "cb_edges": grids["cb_edges"],
+          "log_scale": CB_BINNING == "log", "cmap": M_CMAP_STYLE}),
+        ("node_metrics",
+         prefix + f"cmap_spreading_potential_{network_name}.png",
+         dict(drawing, values=[M / num_nodes * 100],
+              labels=["Percentage of network infected"],
+              titles=["Spreading potential of each node in the "
+                      f"{network_name} network"],
+              cmap=M_CMAP_STYLE))]
+
+
+def network_jobs(network_name, num_workers=1):
+    """(kind, path, inputs) of all the figures of one network, whose
+    betweenness centrality is computed by num_workers processes"""
+    G = load_network(network_name)
+    indptr, indices = graph_to_csr(G)
+    corenesses = coreness(G)
+    degrees = np.diff(indptr)
+    centralities = np.array(list(betweenness_centrality(
+        G, epsilon=CB_EPSILON, relative=CB_RELATIVE,
+        num_workers=num_workers).values()))
+    pos = stress_layout(G, quality=LAYOUT_QUALITY)
+    positions = np.array([pos[node] for node in G.nodes])
+    drawing = {"positions": positions,
+               "segments": edge_segments(indptr, indices, positions),
+               "node_size": NODE_SIZE, "edge_width": EDGE_WIDTH}
+    directory = OUTPUT + network_name + "/"
+
+    jobs = metric_jobs(directory, network_name, drawing, corenesses, degrees,
+                       centralities, shell_drawing(indptr, indices, positions,
+                                                   corenesses))
+    for tag, M, metadata, node_ids in simulations(network_name):
+        try:
+            M = align_to_graph(M, G, metadata, node_ids)
+        except ValueError as error:
+            print(f"Skipping the {tag or 'default'} simulation of "
+                  f"{network_name}: {error}")
+            continue
+        jobs += spreading_jobs(
+            directory + (f"{tag}_" if tag else ""), network_name, drawing, M,
+            analysis_grids(M, corenesses, degrees, centralities,
+                           NUM_CB_BINS, CB_BINNING))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Renders the figures of every network, in parallel")
+    parser.add_argument("--networks", nargs="*", default=network_names(),
+                        help="networks of data/ to render the figures of")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU core)")
+    parser.add_argument("--force", action="store_true",
+                        help="also render the figures that are up to date")
+    args = parser.parse_args()
+
+    jobs = []
+    with stage("figure_inputs", networks=args.networks):
+        for network_name in args.networks:
+            jobs += network_jobs(network_name, args.workers)
+    with stage("figure_rendering", figures=len(jobs)):
+        rendered, skipped = render_figures(jobs, args.workers, args.force)
+    print(f"{len(rendered)} figures rendered, {len(skipped)} up to date.")
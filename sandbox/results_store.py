@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import struct
+import zipfile
+
+import numpy as np
+from scipy import io
+
+from network_loader import csr_to_graph, save_atomically
+from metric_store import csr_fingerprint, graph_fingerprint
+
+"""Version of the results format, stored in the metadata of every file"""
+FORMAT_VERSION = 1
+
+
+def save_results(path, results, indptr, indices, node_ids, network_name,
+                 params, compressed=True):
+    """Writes the per-node results of a sweep to an .npz file, with all it
+    takes to use them without the source network
+
+    Every array of results (M, M_SE, M_CI, NUM_REALISATIONS, ...) is a
+    column of its own, next to node_ids (the id of the node of each row),
+    the CSR adjacency the sweep ran on (indptr, indices) and a JSON metadata
+    column: network name, graph fingerprint, params (the model parameters
+    and seed), format version and creation time. Columns are compressed
+    unless compressed=False, in which case load_results can memory-map
+    them."""
+    metadata = {"format_version": FORMAT_VERSION,
+                "network_name": network_name,
+                "fingerprint": csr_fingerprint(indptr, indices, node_ids),
+                "params": params,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    save = np.savez_compressed if compressed else np.savez
+    if not path.endswith(".npz"):
+        path += ".npz"
+    save_atomically(path, save, **results, node_ids=node_ids, indptr=indptr,
+                    indices=indices, metadata=np.array(json.dumps(metadata)))
+
+
+def _memmap_column(path, name):
+    """Read-only memory map of a column of an .npz file, None if the column
+    is compressed or empty (neither can be memory-mapped)"""
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, "rb") as f:
+        # Local file header: 30 bytes, then the file name and extra field
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack("<HH", f.read(4))
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        read_header = (np.lib.format.read_array_header_1_0
+                       if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0)
+        shape, fortran_order, dtype = read_header(f)
+        offset = f.tell()
+    if np.prod(shape) == 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                     order="F" if fortran_order else "C")
+
+
+def _load_mat(path):
+    """Columns and metadata of a .mat file of the previous format, which
+    only has M (and sometimes its statistics) and NETWORK_NAME"""
+    mdic = io.loadmat(path)
+    metadata = {"format_version": 0,
+                "network_name": str(mdic.pop("NETWORK_NAME")[0])}
+    # savemat stores 1D arrays as (1 x n) matrices
+    columns = {name: value[0] if value.ndim == 2 and value.shape[0] == 1
+               else value for name, value in mdic.items()
+               if not name.startswith("__")}
+    return columns, metadata
+
+
+def load_results(path, columns=None, mmap=False):
+    """Columns of a results file, as a dict of arrays, and its metadata
+
+    Only the columns asked for are read (all of them if None), leaving out
+    those the file does not have (e.g. the histograms of final sizes of
+    older files); with mmap, the uncompressed ones are memory-mapped instead
+    (the others, e.g. of compressed older files, are read as usual). path
+    may leave out the extension, in which case the .npz file is read if
+    there is one, and otherwise the .mat file of the previous format, which
+    has no node ids, adjacency nor parameters (its metadata only has the
+    network name)."""
+    if not path.endswith((".npz", ".mat")):
+        path += ".npz" if os.path.exists(path + ".npz") else ".mat"
+    if path.endswith(".mat"):
+        data, metadata = _load_mat(path)
+        return ({name: data[name] for name in columns if name in data}
+                if columns is not None else data), metadata
+
+    with np.load(path) as archive:
+        metadata = json.loads(archive["metadata"][()])
+        if columns is None:
+            columns = [name for name in archive.files if name != "metadata"]
+        columns = [name for name in columns if name in archive.files]
+        data = {}
+        for name in columns:
+            column = _memmap_column(path, name) if mmap else None
+            data[name] = archive[name] if column is None else column
+    return data, metadata
+
+
+def results_graph(data):
+    """networkx Graph the results were computed on, from their indptr,
+    indices and node_ids columns"""
+    return csr_to_graph(data["indptr"], data["indices"], data["node_ids"])
+
+
+def align_to_graph(values, G, metadata, node_ids=None):
+    """Per-node values of a results file, in the order of G.nodes
+
+    If G is the network the results were computed on (same fingerprint),
+    values are already in its order. Otherwise their rows are reordered by
+    node id (node_ids, the column of the same name); a ValueError is raised
+    if there is no result for some node of G. Results of the previous format
+    have no node ids, and are only checked to have one row per node."""
+    if metadata.get("fingerprint") == graph_fingerprint(G):
+        return values
+    if node_ids is None:
+        if len(values) != G.number_of_nodes():
+            raise ValueError(f"{len(values)} results for the "
+                             f"{G.number_of_nodes()} nodes of the network.")
+        return values
+    row = {node: i for i, node in enumerate(node_ids.tolist())}
+    missing = [node for node in G.nodes if node not in row]
+    if missing:
+        raise ValueError(f"No results for {len(missing)} nodes of the "
+                         f"network, e.g. {missing[:5]}.")
+    return np.asarray(values)[[row[node] for node in G.nodes]]
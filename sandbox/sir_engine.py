@@ -0,0 +1,185 @@
+import numpy as np
+
+"""Node status codes, the same as the ones used by ndlib's SIRModel"""
+SUSCEPTIBLE = 0
+INFECTED = 1
+RECOVERED = 2
+
+"""Duration given to realisations still active after the last iteration"""
+STILL_ACTIVE = -1
+
+
+def frontier_neighbours(indptr, indices, frontier):
+    """All (source position, neighbour) pairs leaving the nodes in frontier
+
+    Returns the position in frontier of the source of each edge, and the
+    neighbour it points to, without any Python-level loop over the nodes."""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    total = counts.sum()
+    if total == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    sources = np.repeat(np.arange(len(frontier)), counts)
+    # Offset of every edge relative to the start of its own row
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return sources, indices[np.repeat(starts, counts) + offsets]
+
+
+def sir_step(indptr, indices, status, infected, beta, gamma, rng):
+    """Advances an SIR realisation by one iteration, in place
+
+    status holds the status code of every node and infected the nodes with
+    status INFECTED (the frontier); nothing else about the history of the
+    realisation is kept. Each infected node infects each of its susceptible
+    neighbours with probability beta, and then recovers with probability
+    gamma. Returns the new frontier and the number of nodes that recovered."""
+    _, neighbours = frontier_neighbours(indptr, indices, infected)
+    # Susceptible status is read before this iteration's infections, so
+    # that every infected neighbour gets its own independent attempt
+    neighbours = neighbours[status[neighbours] == SUSCEPTIBLE]
+    newly_infected = np.unique(
+        neighbours[rng.random(len(neighbours)) < beta])
+
+    recovering = rng.random(len(infected)) < gamma
+    status[infected[recovering]] = RECOVERED
+
+    status[newly_infected] = INFECTED
+    return (np.concatenate((infected[~recovering], newly_infected)),
+            np.count_nonzero(recovering))
+
+
+def simulate_sir(indptr, indices, starting_node, beta, gamma,
+                 num_iterations, rng=None, return_duration=False):
+    """Runs one realisation of the SIR model and returns its final size
+
+    Same semantics as ndlib's SIRModel (see sir_step). As with
+    iteration_bunch(num_iterations), the first iteration is the initial
+    configuration, so the process is only advanced num_iterations - 1 times.
+    The returned value is the number of recovered nodes in the last
+    iteration, i.e. node_count[2][-1] of the trends built by ndlib. Only the
+    infected frontier and a recovered counter are tracked, so no iteration
+    history is ever built; see sir_trends for the full time series.
+
+    The run stops as soon as no node is infected any more, since nothing can
+    change after that. With return_duration=True, the number of steps after
+    which the outbreak died out is returned too, or STILL_ACTIVE if it was
+    cut short by num_iterations: an outbreak lasting d steps is fully
+    simulated as long as num_iterations > d."""
+    if rng is None:
+        rng = np.random.default_rng()
+    status = np.full(len(indptr) - 1, SUSCEPTIBLE, dtype=np.int8)
+    status[starting_node] = INFECTED
+    infected = np.array([starting_node], dtype=np.int64)
+    recovered = 0
+    duration = STILL_ACTIVE
+
+    for step in range(num_iterations - 1):
+        infected, num_recovering = sir_step(
+            indptr, indices, status, infected, beta, gamma, rng)
+        recovered += num_recovering
+        if len(infected) == 0:
+            duration = step + 1
+            break
+
+    if return_duration:
+        return recovered, duration
+    return recovered
+
+
+def sir_trends(indptr, indices, initial_infected, beta, gamma,
+               num_iterations, rng=None):
+    """Number of susceptible, infected and recovered nodes at every iteration
+
+    Opt-in counterpart of simulate_sir for diffusion trend plots: the
+    realisation starts with the nodes of initial_infected infected, and row t
+    of the returned (num_iterations x 3) array holds the node counts of
+    iteration t, indexed by status code like ndlib's node_count. Once the
+    outbreak is over the last row is repeated, without simulating further."""
+    if rng is None:
+        rng = np.random.default_rng()
+    status = np.full(len(indptr) - 1, SUSCEPTIBLE, dtype=np.int8)
+    infected = np.unique(np.asarray(initial_infected, dtype=np.int64))
+    status[infected] = INFECTED
+    trends = np.zeros((num_iterations, 3), dtype=np.int64)
+    trends[0] = np.bincount(status, minlength=3)
+
+    for step in range(1, num_iterations):
+        if len(infected) == 0:
+            trends[step:] = trends[step - 1]
+            break
+        infected, num_recovering = sir_step(
+            indptr, indices, status, infected, beta, gamma, rng)
+        recovered = trends[step - 1, RECOVERED] + num_recovering
+        trends[step] = (len(status) - len(infected) - recovered,
+                        len(infected), recovered)
+    return trends
+
+
+def column_random(rng, active, cols):
+    """Uniform draws for state matrix entries listed column by column
+
+    rng is either a single Generator shared by the whole batch, or a sequence
+    with one Generator per realisation (column). In the latter case the
+    entries of each column are drawn from that column's own stream, so the
+    outcome of a realisation does not depend on the rest of the batch."""
+    if isinstance(rng, np.random.Generator):
+        return rng.random(len(cols))
+    counts = np.bincount(cols, minlength=len(active))
+    return np.concatenate(
+        [np.zeros(0)] + [rng[active[c]].random(counts[c])
+                         for c in np.flatnonzero(counts)])
+
+
+def simulate_sir_batch(adjacency, starting_nodes, beta, gamma,
+                       num_iterations, rng=None, return_durations=False):
+    """Runs one SIR realisation per entry of starting_nodes, all at once
+
+    Each realisation is a column of a boolean (nodes x realisations) state
+    matrix, and all the columns are advanced together: the number of infected
+    neighbours of every node is a single sparse matrix-times-state product,
+    and a susceptible node with c infected neighbours is infected with
+    probability 1 - (1 - beta)^c, which is the same as c independent
+    attempts with probability beta as in simulate_sir. Returns the final
+    number of recovered nodes of every realisation. rng may also be a
+    sequence of one Generator per realisation (see column_random).
+
+    Columns drop out of the batch as soon as their outbreak is over, and the
+    loop ends when all of them have. With return_durations=True, the number
+    of steps each outbreak lasted (STILL_ACTIVE if it was still going on at
+    the last iteration, see simulate_sir) is returned too."""
+    if rng is None:
+        rng = np.random.default_rng()
+    num_nodes = adjacency.shape[0]
+    num_realisations = len(starting_nodes)
+    columns = np.arange(num_realisations)
+    infected = np.zeros((num_nodes, num_realisations), dtype=bool)
+    infected[starting_nodes, columns] = True
+    recovered = np.zeros((num_nodes, num_realisations), dtype=bool)
+    durations = np.full(num_realisations, STILL_ACTIVE, dtype=np.int64)
+
+    for step in range(num_iterations - 1):
+        # Columns whose outbreak is over need no further work
+        active = np.flatnonzero(durations == STILL_ACTIVE)
+        if len(active) == 0:
+            break
+        state = infected[:, active]
+        pressure = adjacency @ state.astype(np.int32)
+        exposed = (pressure > 0) & ~state & ~recovered[:, active]
+        # Entries are listed column by column, see column_random
+        cols, rows = np.nonzero(exposed.T)
+        p_infection = 1 - (1 - beta) ** pressure[rows, cols]
+        caught = column_random(rng, active, cols) < p_infection
+
+        cols_i, rows_i = np.nonzero(state.T)
+        recovering = column_random(rng, active, cols_i) < gamma
+        state[rows_i[recovering], cols_i[recovering]] = False
+        recovered[rows_i[recovering], active[cols_i[recovering]]] = True
+
+        state[rows[caught], cols[caught]] = True
+        infected[:, active] = state
+        durations[active[~state.any(axis=0)]] = step + 1
+
+    if return_durations:
+        return recovered.sum(axis=0), durations
+    return recovered.sum(axis=0)
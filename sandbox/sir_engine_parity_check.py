@@ -0,0 +1,70 @@
+import numpy as np
+from scipy import stats
+
+import ndlib.models.epidemics as ep
+import ndlib.models.ModelConfig as mconf
+
+from network_loader import graph_to_csr, load_network
+from sir_engine import simulate_sir, simulate_sir_batch
+from worker_pool import adjacency_matrix
+
+"""Checks that the CSR SIR engines reproduce ndlib's SIRModel final sizes"""
+NETWORK_NAMES = ["karate", "dolphins"]
+BETAS = [0.1, 0.3]
+GAMMAS = [1.0, 0.5]
+NUM_ITERATIONS = 30
+NUM_REALISATIONS = 1000
+NUM_STARTING_NODES = 3  # highest, median and lowest degree nodes
+SIGNIFICANCE = 0.001  # two-sample KS test, per (network, beta, gamma, node)
+
+
+def ndlib_final_size(G, starting_node, beta, gamma):
+    """Final number of recovered nodes of one ndlib SIRModel realisation"""
+    model = ep.SIRModel(G)
+    config = mconf.Configuration()
+    config.add_model_parameter('beta', beta)
+    config.add_model_parameter('gamma', gamma)
+    config.add_model_initial_configuration('Infected', [starting_node])
+    model.set_initial_status(config)
+    iterations = model.iteration_bunch(NUM_ITERATIONS)
+    trends = model.build_trends(iterations)
+    return trends[0]["trends"]["node_count"][2][-1]
+
+
+rng = np.random.default_rng(0)
+np.random.seed(0)
+mismatches = 0
+for network_name in NETWORK_NAMES:
+    G = load_network(network_name)
+    indptr, indices = graph_to_csr(G)
+    adjacency = adjacency_matrix(indptr, indices)
+
+    nodes = list(G.nodes)
+    by_degree = sorted(range(len(nodes)), key=lambda i: G.degree(nodes[i]))
+    starting_indices = [by_degree[-1], by_degree[len(by_degree) // 2],
+                        by_degree[0]][:NUM_STARTING_NODES]
+
+    for beta in BETAS:
+        for gamma in GAMMAS:
+            for i in starting_indices:
+                reference = [ndlib_final_size(G, nodes[i], beta, gamma)
+                             for _ in range(NUM_REALISATIONS)]
+                engine = [simulate_sir(indptr, indices, i, beta, gamma,
+                                       NUM_ITERATIONS, rng)
+                          for _ in range(NUM_REALISATIONS)]
+                batch = simulate_sir_batch(
+                    adjacency, [i]*NUM_REALISATIONS, beta, gamma,
+                    NUM_ITERATIONS, rng)
+                for engine_name, final_sizes in [("engine", engine),
+                                                 ("batch", batch)]:
+                    p_value = stats.ks_2samp(reference, final_sizes).pvalue
+                    status = "ok" if p_value >= SIGNIFICANCE else "MISMATCH"
+                    mismatches += p_value < SIGNIFICANCE
+                    print(f"{network_name} beta={beta} gamma={gamma} "
+                          f"node={nodes[i]}: ndlib M={np.mean(reference):.3f}"
+                          f" {engine_name} M={np.mean(final_sizes):.3f} "
+                          f"(KS p={p_value:.3f}) {status}")
+
+if mismatches:
+    raise SystemExit(f"{mismatches} final size distributions differ.")
+print("CSR SIR engines match ndlib's SIRModel.")
@@ -1,39 +1,108 @@
-import networkx as nx
-import ndlib.models.epidemics as ep
-import ndlib.models.ModelConfig as mconf
-from ndlib.viz.mpl.DiffusionTrend import DiffusionTrend
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from network_loader import (
+    network_names, load_network, load_network_csr, graph_to_csr)
+from sir_engine import SUSCEPTIBLE, INFECTED, RECOVERED, sir_trends
+from sir_tuning import mean_field_threshold, outbreak_curve, recommend_beta
 
-NETWORK_NAME = "power"
 OUTPUT = "output/"
 
-# Select the node in which to start the infection
-starting_node = 0
+parser = argparse.ArgumentParser(
+    description="Epidemic threshold and outbreak size curve of networks of "
+                "data/, and the diffusion trend of a single realisation")
+parser.add_argument("--networks", nargs="*", default=network_names(),
+                    help="networks of data/ to find the recommended beta of "
+                         "(default: all of them)")
+parser.add_argument("--network", default="power",
+                    help="network of the diffusion trend (default: power)")
+parser.add_argument("--starting-node", type=int, default=None,
+                    help="node id the infection of the diffusion trend "
+                         "starts at (default: the first node of the network)")
+args = parser.parse_args()
+
+"""Epidemic threshold and outbreak size curve of the selected networks"""
+BETA_GRID = np.geomspace(0.005, 1.0, 50)
+NUM_PERCOLATION_SAMPLES = 50  # Each one is a realisation from every node
+MASTER_SEED = 30
+
+recommended = {}
+for network_name in args.networks:
+    indptr, indices, _ = load_network_csr(network_name)
+    mean, chi = outbreak_curve(indptr, indices, BETA_GRID,
+                               NUM_PERCOLATION_SAMPLES, MASTER_SEED)
+    recommended[network_name] = recommend_beta(BETA_GRID, chi)
+    threshold = mean_field_threshold(indptr)
+    print(f"{network_name}: recommended beta = "
+          f"{recommended[network_name]:.3f} (peak of chi), mean field "
+          f"threshold = {threshold:.3f}.")
+
+    fig, ax = plt.subplots(nrows=1, ncols=1)
+    ax.plot(BETA_GRID, mean, label="$\\langle\\rho\\rangle$")
+    ax.plot(BETA_GRID, chi / chi.max(), label="$\\chi$ (normalised)")
+    ax.axvline(recommended[network_name], color="k", ls="--",
+               label="recommended $\\beta$")
+    ax.axvline(threshold, color="gray", ls=":", label="mean field threshold")
+    ax.set_xscale("log")
+    ax.set_xlabel("$\\beta$")
+    ax.set_ylabel("Fraction of network infected")
+    ax.set_title(f"SIR ($\\gamma$ = 1) outbreak size in the {network_name} "
+                 f"network")
+    ax.legend(loc="best", fontsize="small")
+    plt.tight_layout()
+    plt.savefig(OUTPUT + f"sir_tuning_{network_name}.png")
+    plt.close(fig)
+
+
+"""Diffusion trend of a single realisation"""
+NETWORK_NAME = args.network
 
 # Relevant Datasets
-G = nx.read_gml(f"./data/{NETWORK_NAME}.gml", label="id")
+G = load_network(NETWORK_NAME)
 # G = nx.erdos_renyi_graph(1000, 0.1)
 # G = nx.watts_strogatz_graph(1000, 5, 0.1)
 # G = nx.barabasi_albert_graph(n=1000, m=3)
-# G = nx.read_edgelist(
-#     f"data/{NETWORK_NAME}.txt", create_using=nx.Graph(), nodetype=int)
-# Input graph has self loops which is not permitted
-G.remove_edges_from(nx.selfloop_edges(G))
-G = G.subgraph(sorted(nx.connected_components(G), key=len, reverse=True)[0])
-
-# Choose which model to use SIR or SIS (maybe SEIR)
-model = ep.SIRModel(G)
-config = mconf.Configuration()
-config.add_model_parameter('beta', 0.65)
-config.add_model_parameter('gamma', 1.0)
-initial_infected = [starting_node]
-config.add_model_initial_configuration('Infected', initial_infected)
-model.set_initial_status(config)
-
-# Sim
-iterations = model.iteration_bunch(200)
-trends = model.build_trends(iterations)
-
-# Plotting
-viz = DiffusionTrend(model, trends)
-viz.plot(
+# Model networks may have self loops and disconnected components
+# G.remove_edges_from(nx.selfloop_edges(G))
+# G = G.subgraph(
+#     sorted(nx.connected_components(G), key=len, reverse=True)[0])
+
+# Select the node in which to start the infection
+starting_node = (next(iter(G.nodes)) if args.starting_node is None
+                 else args.starting_node)
+
+# SIR model parameters (BETA = None: the beta recommended above)
+BETA = 0.65
+GAMMA = 1.0
+NUM_ITERATIONS = 200
+if BETA is None:
+    if NETWORK_NAME not in recommended:
+        parser.error(f"BETA = None takes the recommended beta of "
+                     f"{NETWORK_NAME}, which has to be one of --networks.")
+    BETA = recommended[NETWORK_NAME]
+
+# Sim: node counts of every status at each iteration, the only place where
+# the full time series is needed (the simulations only keep final sizes)
+indptr, indices = graph_to_csr(G)
+initial_infected = [list(G.nodes).index(starting_node)]
+trends = sir_trends(indptr, indices, initial_infected, BETA, GAMMA,
+                    NUM_ITERATIONS)
+
+# Plotting, in the style of ndlib's DiffusionTrend
+fig, ax = plt.subplots(nrows=1, ncols=1)
+for status, label in [(SUSCEPTIBLE, "Susceptible"), (INFECTED, "Infected"),
+                      (RECOVERED, "Removed")]:
+    ax.plot(range(NUM_ITERATIONS), trends[:, status] / len(G.nodes),
+            lw=2, alpha=0.5, label=label)
+ax.set_title("SIR - Diffusion Trend")
+ax.set_xlabel("Iterations")
+ax.set_ylabel("#Nodes")
+ax.set_xlim(0, NUM_ITERATIONS - 1)
+ax.set_ylim(0, 1)
+ax.legend(loc="best", fontsize="small")
+ax.grid(axis="y")
+plt.tight_layout()
+plt.savefig(
     OUTPUT + f"diffusion_trend_start_node_{starting_node}_{NETWORK_NAME}.png")
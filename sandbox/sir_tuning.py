@@ -0,0 +1,48 @@
+import numpy as np
+
+from percolation_engine import iter_cluster_sizes, sample_rngs
+
+
+def mean_field_threshold(indptr):
+    """Epidemic threshold <k> / (<k^2> - <k>) of heterogeneous mean field
+    theory, from the degrees of the network
+
+    For gamma = 1 this is the critical transmissibility, i.e. beta, above
+    which outbreaks can reach a finite fraction of an uncorrelated network
+    with the same degree distribution."""
+    degrees = np.diff(indptr).astype(float)
+    return degrees.mean() / ((degrees ** 2).mean() - degrees.mean())
+
+
+def outbreak_curve(indptr, indices, betas, num_samples, master_seed,
+                   samples_per_batch=20):
+    """Average outbreak size and its variability over a grid of betas, for
+    gamma = 1
+
+    Every (starting node, bond percolation sample) pair is a realisation of
+    the outbreak, so that all the nodes are used as seeds (see
+    iter_cluster_sizes); the samples are shared by all the betas. Returns,
+    for every beta, the average fraction <rho> of the network reached by an
+    outbreak and its variability chi = sqrt(<rho^2> - <rho>^2) / <rho>,
+    which peaks at the epidemic threshold of the network."""
+    num_nodes = len(indptr) - 1
+    sums = np.zeros(len(betas))
+    sums_squares = np.zeros(len(betas))
+    for start in range(0, num_samples, samples_per_batch):
+        rngs = sample_rngs(master_seed, start,
+                           min(start + samples_per_batch, num_samples))
+        for k, sizes in enumerate(iter_cluster_sizes(
+                indptr, indices, betas, rngs)):
+            rho = sizes / num_nodes
+            sums[k] += rho.sum()
+            sums_squares[k] += (rho ** 2).sum()
+
+    mean = sums / (num_nodes * num_samples)
+    variance = sums_squares / (num_nodes * num_samples) - mean ** 2
+    return mean, np.sqrt(np.maximum(variance, 0)) / mean
+
+
+def recommend_beta(betas, chi):
+    """beta of the grid closest to the epidemic threshold, where the
+    variability chi of the outbreak sizes is the largest"""
+    return betas[np.argmax(chi)]
@@ -0,0 +1,170 @@
+import numpy as np
+
+from instrumentation import log_event
+
+
+def select_beta(mdic, beta, field="M"):
+    """M (or another per-node field) of every node for one of the betas of a
+    beta sweep
+
+    mdic holds the columns of the results written by beta_sweep_each_node.py
+    (see load_results), whose M has one column per beta of its BETAS (and
+    so do SIZE_HIST and SIZE_HIST_SUMS)."""
+    betas = mdic["BETAS"].ravel()
+    column = np.flatnonzero(np.isclose(betas, beta))
+    if len(column) == 0:
+        raise ValueError(f"beta = {beta} is not part of the sweep, which "
+                         f"has betas {betas.tolist()}.")
+    return mdic[field][:, column[0]]
+
+
+def bin_index(values, unique_values):
+    """Index of each value in the sorted array of unique values"""
+    return np.searchsorted(unique_values, values)
+
+
+def mean_grid(row_index, column_index, M, shape):
+    """Average M over the nodes falling in each (row, column) cell of a grid
+
+    row_index and column_index hold, for every node, the row and column of
+    the cell it belongs to. All cells are filled in a single pass over the
+    nodes with np.bincount. Returns the grid of average M (0 for the cells
+    without any node) and the grid with the number of nodes in each cell, so
+    that under-sampled cells can be told apart."""
+    cell = np.ravel_multi_index((row_index, column_index), shape)
+    size = shape[0] * shape[1]
+    sums = np.bincount(cell, weights=M, minlength=size).reshape(shape)
+    counts = np.bincount(cell, minlength=size).reshape(shape)
+    means = np.divide(sums, counts, out=np.zeros(shape), where=counts != 0)
+    return means, counts
+
+
+def histogram_grid(row_index, column_index, histograms, shape):
+    """Sum of the per-node (nodes x bins) histograms of the nodes falling in
+    each (row, column) cell of a grid, as a (rows x columns x bins) array
+
+    The histograms of final sizes of run_sweep and beta_sweep (SIZE_HIST and
+    SIZE_HIST_SUMS) pool this way into the distribution of final sizes of
+    the outbreaks started in each cell, see major_outbreaks."""
+    cell = np.ravel_multi_index((row_index, column_index), shape)
+    histograms = np.asarray(histograms)
+    pooled = np.zeros((shape[0] * shape[1], histograms.shape[1]),
+                      dtype=histograms.dtype)
+    np.add.at(pooled, cell, histograms)
+    return pooled.reshape(shape + (histograms.shape[1],))
+
+
+def major_outbreaks(counts, sums, edges, threshold):
+    """Probability of a major outbreak, reaching at least threshold nodes,
+    and mean final size of the major outbreaks, from histograms of final
+    sizes (counts and sums of the sizes in each bin of edges, last axis)
+
+    threshold is rounded to the nearest bin edge, so that the conditional
+    mean is exact rather than estimated from the bin centres. Returns both
+    arrays (NaN where there is no realisation, respectively no major
+    outbreak) and the threshold actually used."""
+    first = np.argmin(np.abs(edges[:-1] - threshold))
+    major_counts = counts[..., first:].sum(axis=-1)
+    total_counts = counts.sum(axis=-1)
+    probability = np.divide(major_counts, total_counts,
+                            out=np.full(major_counts.shape, np.nan),
+                            where=total_counts != 0)
+    mean_size = np.divide(sums[..., first:].sum(axis=-1), major_counts,
+                          out=np.full(major_counts.shape, np.nan),
+                          where=major_counts != 0)
+    return probability, mean_size, edges[first]
+
+
+def report_sampling(name, counts, min_count=5):
+    """Logs how many of the non-empty cells of a grid are under-sampled"""
+    occupied = np.count_nonzero(counts)
+    sparse_cells = np.count_nonzero((counts > 0) & (counts < min_count))
+    log_event("grid_sampling",
+              f"{name}: {occupied} non-empty cells, {sparse_cells} of which "
+              f"have fewer than {min_count} nodes.",
+              grid=name, occupied_cells=occupied, sparse_cells=sparse_cells,
+              min_count=min_count)
+
+
+def bin_edges(values, num_bins, scale="linear"):
+    """Edges of (at most) num_bins bins covering the range of values
+
+    scale is either "linear" (equal width bins), "log" (equal width bins in
+    log scale, starting at the smallest positive value, plus a first bin
+    [0, smallest positive value) of its own for the null values if there are
+    any, see display_edges; just that bin, [0, 1), when all the values are
+    null, e.g. the centralities of a complete graph) or "quantile" (bins
+    holding about the same number of values; bins that would be empty
+    because of repeated values are merged)."""
+    values = np.asarray(values, dtype=float)
+    if scale == "linear":
+        return np.linspace(values.min(), values.max(), num_bins + 1)
+    if scale == "log":
+        positive = values[values > 0]
+        if len(positive) == 0:
+            return np.array([0.0, 1.0])
+        edges = np.geomspace(positive.min(), positive.max(), num_bins + 1)
+        if len(positive) < len(values):
+            edges = np.concatenate(([0], edges))
+        return edges
+    if scale == "quantile":
+        return np.unique(np.quantile(values, np.linspace(0, 1, num_bins + 1)))
+    raise ValueError(f"Unknown binning scale {scale!r}, expected "
+                     f"'linear', 'log' or 'quantile'.")
+
+
+def binned_index(values, edges):
+    """Index of the bin, given by its edges, in which each value falls
+
+    Bins are closed on the left, except the last one which is closed on both
+    sides. Values outside the edges are put in the first or last bin."""
+    return np.clip(np.searchsorted(edges, values, side="right") - 1,
+                   0, len(edges) - 2)
+
+
+def display_edges(edges, log_scale):
+    """Bin edges as drawn on the C_B axis of a heatmap, and the centre of
+    the row of the null values (None if there is no such row)
+
+    On a log axis, the bin of the null values of log bins (see bin_edges)
+    cannot start at 0, and is drawn below the lowest positive one instead,
+    as tall as an eighth of the range of the positive bins (in log scale,
+    or a decade if there are none) so that its label 0 stands apart from
+    those of the axis."""
+    if not log_scale or edges[0] > 0:
+        return edges, None
+    edges = np.array(edges, dtype=float)
+    decades = np.log10(edges[-1] / edges[1]) / 8 if len(edges) > 2 else 1
+    edges[0] = edges[1] / 10 ** decades
+    return edges, np.sqrt(edges[0] * edges[1])
+
+
+def analysis_grids(M, corenesses, degrees, centralities, num_cb_bins=25,
+                   cb_binning="log"):
+    """The M(k_s, k), M(k_s, C_B) and M(k, C_B) grids of the
+    *_process_analysis.py scripts, from per-node arrays aligned with M
+
+    Returns a dict with the grids of average M and their node counts
+    (ks_vs_k, ks_vs_cb, k_vs_cb and the same with a _counts suffix), along
+    with their axes: unique_coreness, unique_degrees and the C_B bin edges
+    cb_edges."""
+    unique_coreness = np.unique(corenesses)
+    unique_degrees = np.unique(degrees)
+    cb_edges = bin_edges(centralities, num_cb_bins, cb_binning)
+    coreness_index = bin_index(corenesses, unique_coreness)
+    degree_index = bin_index(degrees, unique_degrees)
+    centrality_index = binned_index(centralities, cb_edges)
+    ks_vs_k, ks_vs_k_counts = mean_grid(
+        degree_index, coreness_index, M,
+        (len(unique_degrees), len(unique_coreness)))
+    ks_vs_cb, ks_vs_cb_counts = mean_grid(
+        centrality_index, coreness_index, M,
+        (len(cb_edges) - 1, len(unique_coreness)))
+    k_vs_cb, k_vs_cb_counts = mean_grid(
+        centrality_index, degree_index, M,
+        (len(cb_edges) - 1, len(unique_degrees)))
+    return {"ks_vs_k": ks_vs_k, "ks_vs_k_counts": ks_vs_k_counts,
+            "ks_vs_cb": ks_vs_cb, "ks_vs_cb_counts": ks_vs_cb_counts,
+            "k_vs_cb": k_vs_cb, "k_vs_cb_counts": k_vs_cb_counts,
+            "unique_coreness": unique_coreness,
+            "unique_degrees": unique_degrees, "cb_edges": cb_edges}
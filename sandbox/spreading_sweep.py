@@ -0,0 +1,395 @@
+import os
+import json
+import time
+from concurrent.futures import as_completed
+
+import numpy as np
+from scipy import stats
+
+import worker_pool
+from sir_engine import STILL_ACTIVE, simulate_sir_batch
+from worker_pool import init_adjacency, process_pool
+from metric_store import csr_fingerprint
+from instrumentation import log_event, format_duration
+
+"""Per-node results of a sweep, as saved next to M in the output files"""
+RESULT_FIELDS = {"M": np.float64,
+                 "M_SE": np.float64,
+                 "TRUNCATED": np.float64,
+                 "NUM_REALISATIONS": np.int64}
+"""Per-node (nodes x size bins) histograms of the final sizes: number of
+realisations, and sum of their final sizes, in each bin (see size_bin_edges)"""
+HISTOGRAM_FIELDS = {"SIZE_HIST": np.int64,
+                    "SIZE_HIST_SUMS": np.float64}
+
+
+def realisation_rngs(master_seed, starting_nodes, num_realisations, first=0):
+    """Independent RNG stream for every (starting node, realisation) pair
+
+    Each stream is seeded from (master_seed, node index, realisation), so the
+    draws of a realisation never depend on how the nodes are split into
+    batches or across workers, nor on how many realisations were run before
+    it (realisations first to first + num_realisations - 1 are returned).
+    The streams are ordered as np.repeat(starting_nodes, num_realisations)."""
+    return [np.random.default_rng([master_seed, int(node), realisation])
+            for node in starting_nodes
+            for realisation in range(first, first + num_realisations)]
+
+
+def standard_error(sums, sums_squares, counts):
+    """Standard error of the mean of samples given by their sums, sums of
+    squares and sizes (infinite for fewer than two samples)"""
+    counts = np.asarray(counts, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = (sums_squares - sums ** 2 / counts) / (counts - 1)
+        se = np.sqrt(np.maximum(variance, 0) / counts)
+    return np.where(counts > 1, se, np.inf)
+
+
+def confidence_interval(means, se, confidence=0.95):
+    """Normal confidence intervals of means with standard errors se, at the
+    given confidence level, as a (lower, upper) last axis"""
+    half_width = stats.norm.ppf(1 - (1 - confidence) / 2) * se
+    return np.stack((means - half_width, means + half_width), axis=-1)
+
+
+def size_bin_edges(num_nodes, num_bins=20, scale="log"):
+    """Integer edges of a bin [0, 1) of null final sizes, followed by (at
+    most) num_bins bins of final sizes 1 to num_nodes
+
+    A final size can be 0 when the outbreak is still active at the last
+    iteration and its starting node has not recovered yet (gamma < 1, see
+    simulate_sir_batch). Bins are closed on the left and open on the right,
+    the last edge being num_nodes + 1. With scale "log" they have equal
+    widths in log scale (and are merged where they would be narrower than
+    one node), which resolves both the outbreaks that die out early and the
+    major ones; "linear" gives bins of equal widths."""
+    if scale == "log":
+        edges = np.geomspace(1, num_nodes + 1, num_bins + 1)
+    elif scale == "linear":
+        edges = np.linspace(1, num_nodes + 1, num_bins + 1)
+    else:
+        raise ValueError(f"Unknown binning scale {scale!r}, expected "
+                         f"'linear' or 'log'.")
+    return np.concatenate(([0], np.unique(np.round(edges).astype(np.int64))))
+
+
+def size_histograms(sizes, edges):
+    """(rows x bins) number of final sizes, and sum of them, falling in each
+    bin of edges, for every row of a (rows x realisations) array of sizes"""
+    num_rows, num_bins = sizes.shape[0], len(edges) - 1
+    cells = (np.arange(num_rows)[:, None] * num_bins
+             + np.searchsorted(edges, sizes, side="right") - 1).ravel()
+    counts = np.bincount(cells, minlength=num_rows * num_bins)
+    sums = np.bincount(cells, weights=sizes.ravel().astype(float),
+                       minlength=num_rows * num_bins)
+    return (counts.reshape(num_rows, num_bins),
+            sums.reshape(num_rows, num_bins))
+
+
+def simulate_block(starting_nodes, num_realisations, beta, gamma,
+                   num_iterations, master_seed, size_edges, se_target=None,
+                   max_realisations=None):
+    """Final size statistics of each starting node of one block
+
+    Without se_target, every node gets num_realisations realisations.
+    Otherwise realisations are added num_realisations at a time to the nodes
+    whose standard error of M is still above se_target, until it is reached
+    or the node has max_realisations. Returns the sums and sums of squares of
+    the final sizes of every node, its number of realisations and of
+    truncated outbreaks (see simulate_sir_batch), its histograms of final
+    sizes over the bins of size_edges (see size_histograms), the number of
+    outbreaks of the block that died out after each number of steps, and
+    how many seconds were spent on setting up the RNG streams (rng_setup),
+    running the SIR iterations (iterations) and gathering the statistics."""
+    num_nodes = len(starting_nodes)
+    sums = np.zeros(num_nodes)
+    sums_squares = np.zeros(num_nodes)
+    counts = np.zeros(num_nodes, dtype=np.int64)
+    truncated = np.zeros(num_nodes, dtype=np.int64)
+    histograms = np.zeros((num_nodes, len(size_edges) - 1), dtype=np.int64)
+    histogram_sums = np.zeros((num_nodes, len(size_edges) - 1))
+    duration_counts = np.zeros(num_iterations, dtype=np.int64)
+    timings = {"rng_setup": 0.0, "iterations": 0.0, "statistics": 0.0}
+
+    # Every pending node has had the same number of realisations so far
+    pending = np.arange(num_nodes)
+    first = 0
+    while len(pending):
+        step = num_realisations
+        if se_target is not None:
+            step = min(step, max_realisations - first)
+        nodes = starting_nodes[pending]
+        start = time.perf_counter()
+        rngs = realisation_rngs(master_seed, nodes, step, first)
+        setup_done = time.perf_counter()
+        final_sizes, durations = simulate_sir_batch(
+            worker_pool.worker_adjacency, np.repeat(nodes, step), beta,
+            gamma, num_iterations, rngs, return_durations=True)
+        iterations_done = time.perf_counter()
+        final_sizes = final_sizes.reshape(len(pending), step)
+        durations = durations.reshape(len(pending), step)
+        sums[pending] += final_sizes.sum(axis=1)
+        sums_squares[pending] += (final_sizes.astype(float) ** 2).sum(axis=1)
+        counts[pending] += step
+        truncated[pending] += np.count_nonzero(
+            durations == STILL_ACTIVE, axis=1)
+        block_histograms, block_histogram_sums = size_histograms(
+            final_sizes, size_edges)
+        histograms[pending] += block_histograms
+        histogram_sums[pending] += block_histogram_sums
+        duration_counts += np.bincount(
+            durations[durations != STILL_ACTIVE], minlength=num_iterations)
+
+        first += step
+        stop = se_target is None or first >= max_realisations
+        if not stop:
+            se = standard_error(sums[pending], sums_squares[pending],
+                                counts[pending])
+            pending = pending[se > se_target]
+        timings["rng_setup"] += setup_done - start
+        timings["iterations"] += iterations_done - setup_done
+        timings["statistics"] += time.perf_counter() - iterations_done
+        if stop:
+            break
+
+    return (starting_nodes, sums, sums_squares, counts, truncated,
+            histograms, histogram_sums, duration_counts, timings)
+
+
+def report_durations(duration_counts, truncated, num_iterations):
+    """Logs how long the outbreaks lasted compared to num_iterations
+
+    duration_counts[d] is the number of realisations that died out after d
+    steps, and truncated the fraction of the realisations of every starting
+    node that were still active at the last iteration, i.e. whose final size
+    was cut short by num_iterations."""
+    num_truncated = np.count_nonzero(truncated)
+    if num_truncated:
+        log_event(
+            "truncated_outbreaks",
+            f"Warning: outbreaks still active after {num_iterations} "
+            f"iterations for {num_truncated}/{len(truncated)} starting "
+            f"nodes (up to {truncated.max()*100:.1f}% of their "
+            f"realisations); their M is underestimated, consider a larger "
+            f"NUM_ITERATIONS.", num_nodes=num_truncated,
+            max_fraction=truncated.max(), num_iterations=num_iterations)
+    if duration_counts.sum():
+        longest = np.flatnonzero(duration_counts)[-1]
+        covered = np.cumsum(duration_counts) / duration_counts.sum()
+        log_event(
+            "outbreak_durations",
+            f"Outbreaks that died out lasted up to {longest} steps, 99% of "
+            f"them at most {np.searchsorted(covered, 0.99)} steps "
+            f"(NUM_ITERATIONS = {num_iterations}).", longest=longest,
+            quantile_99=np.searchsorted(covered, 0.99),
+            num_iterations=num_iterations)
+
+
+def open_checkpoint(checkpoint_path, num_nodes, params, resume=False,
+                    num_size_bins=0):
+    """Memory-mapped per-node results and completion bitmap of a
+    checkpointed sweep
+
+    Each field of RESULT_FIELDS and HISTOGRAM_FIELDS (with num_size_bins
+    columns) is kept in checkpoint_path + "_<field>.npy" (the values found
+    so far) and checkpoint_path + "_done.npy" tells which nodes they are
+    valid for, next to a .json file with the parameters of the sweep (which
+    should identify the network too, see run_sweep). With resume=True an
+    existing checkpoint is reopened, as long as it was made with the same
+    parameters; otherwise a new, empty one is created. Returns the {field:
+    memmap} results and the bitmap."""
+    params_path = checkpoint_path + ".json"
+    fields = {field: (dtype, (num_nodes,))
+              for field, dtype in RESULT_FIELDS.items()}
+    fields.update({field: (dtype, (num_nodes, num_size_bins))
+                   for field, dtype in HISTOGRAM_FIELDS.items()})
+    paths = {field: checkpoint_path + f"_{field}.npy" for field in fields}
+    done_path = checkpoint_path + "_done.npy"
+    params = dict(params, num_nodes=num_nodes)
+
+    if resume and all(os.path.exists(path) for path in
+                      [params_path, done_path, *paths.values()]):
+        with open(params_path) as f:
+            saved_params = json.load(f)
+        if saved_params != params:
+            raise ValueError(
+                f"Checkpoint {checkpoint_path} was made with parameters "
+                f"{saved_params}, not {params}.")
+        return ({field: np.lib.format.open_memmap(path, mode="r+")
+                 for field, path in paths.items()},
+                np.lib.format.open_memmap(done_path, mode="r+"))
+
+    results = {field: np.lib.format.open_memmap(
+        path, mode="w+", dtype=fields[field][0], shape=fields[field][1])
+        for field, path in paths.items()}
+    done = np.lib.format.open_memmap(
+        done_path, mode="w+", dtype=bool, shape=(num_nodes,))
+    with open(params_path, "w") as f:
+        json.dump(params, f)
+    return results, done
+
+
+def run_sweep(indptr, indices, beta, gamma, num_iterations,
+              num_realisations, master_seed, num_workers=None,
+              nodes_per_batch=20, checkpoint_path=None, resume=False,
+              se_target=None, max_realisations=None, confidence=0.95,
+              num_size_bins=20, size_binning="log"):
+    """Average final size M[i] of an outbreak started at every node i
+
+    The starting nodes are split in blocks of nodes_per_batch, which are
+    simulated in parallel by num_workers processes (os.cpu_count() by
+    default). The network is sent to each worker only once, when it starts.
+    Since every realisation has its own RNG stream derived from master_seed,
+    M is the same whatever num_workers and nodes_per_batch are.
+
+    With se_target (in number of nodes, like M), the number of realisations
+    is chosen node by node by sequential sampling: num_realisations is then
+    the minimum, realisations being added until the standard error of M[i]
+    is at most se_target or there are max_realisations of them (10 times
+    num_realisations by default). See simulate_block.
+
+    If checkpoint_path is given, the result of every block is written to an
+    on-disk checkpoint as soon as it is available (see open_checkpoint), and
+    with resume=True the nodes already done in that checkpoint are skipped.
+
+    Returns a dict of per-node arrays: M, its standard error M_SE and
+    confidence interval M_CI (nodes x 2, at the given confidence level),
+    NUM_REALISATIONS, TRUNCATED, the fraction of realisations still
+    active at the last iteration (see report_durations, which summarises it
+    at the end of the sweep), and the histograms of final sizes SIZE_HIST
+    and SIZE_HIST_SUMS (nodes x bins, see HISTOGRAM_FIELDS) over the bins
+    SIZE_BIN_EDGES (see size_bin_edges), which keep the shape of the
+    distribution M is the mean of in bounded memory."""
+    num_nodes = len(indptr) - 1
+    size_edges = size_bin_edges(num_nodes, num_size_bins, size_binning)
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    if se_target is None:
+        max_realisations = None
+    elif max_realisations is None:
+        max_realisations = 10 * num_realisations
+    if checkpoint_path is None:
+        results = {field: np.zeros(num_nodes, dtype=dtype)
+                   for field, dtype in RESULT_FIELDS.items()}
+        results.update({field: np.zeros((num_nodes, len(size_edges) - 1),
+                                        dtype=dtype)
+                        for field, dtype in HISTOGRAM_FIELDS.items()})
+        done = np.zeros(num_nodes, dtype=bool)
+    else:
+        # The fingerprint of the adjacency keeps a checkpoint made on
+        # another network with as many nodes from being resumed
+        params = {"fingerprint": csr_fingerprint(indptr, indices,
+                                                 np.arange(num_nodes)),
+                  "beta": beta, "gamma": gamma,
+                  "num_iterations": num_iterations,
+                  "num_realisations": num_realisations,
+                  "master_seed": master_seed,
+                  "se_target": se_target,
+                  "max_realisations": max_realisations,
+                  "size_edges": size_edges.tolist()}
+        results, done = open_checkpoint(
+            checkpoint_path, num_nodes, params, resume, len(size_edges) - 1)
+    remaining = np.flatnonzero(~done)
+    blocks = [remaining[start:start + nodes_per_batch]
+              for start in range(0, len(remaining), nodes_per_batch)]
+    num_done = num_nodes - len(remaining)
+    if num_done:
+        log_event("resume",
+                  f"Resuming with {num_done}/{num_nodes} nodes already done.",
+                  num_done=num_done, num_nodes=num_nodes)
+
+    # Durations of the outbreaks simulated in this run (not checkpointed)
+    duration_counts = np.zeros(num_iterations, dtype=np.int64)
+    # Telemetry of this run: realisations simulated, and time spent in each
+    # part of simulate_block, summed over the blocks
+    start = time.perf_counter()
+    run_nodes = 0
+    run_realisations = 0
+    timings = {}
+
+    def record(starting_nodes, sums, sums_squares, counts, truncated,
+               histograms, histogram_sums, block_duration_counts,
+               block_timings, num_done):
+        nonlocal run_nodes, run_realisations
+        results["M"][starting_nodes] = sums / counts
+        results["M_SE"][starting_nodes] = standard_error(
+            sums, sums_squares, counts)
+        results["TRUNCATED"][starting_nodes] = truncated / counts
+        results["NUM_REALISATIONS"][starting_nodes] = counts
+        results["SIZE_HIST"][starting_nodes] = histograms
+        results["SIZE_HIST_SUMS"][starting_nodes] = histogram_sums
+        duration_counts[:] += block_duration_counts
+        # Only flag the nodes as done once their results are safely on disk
+        if checkpoint_path is not None:
+            for values in results.values():
+                values.flush()
+            done[starting_nodes] = True
+            done.flush()
+        run_nodes += len(starting_nodes)
+        run_realisations += counts.sum()
+        for part, seconds in block_timings.items():
+            timings[part] = timings.get(part, 0.0) + seconds
+        elapsed = time.perf_counter() - start
+        eta = elapsed / run_nodes * (num_nodes - num_done)
+        log_event("progress",
+                  f"Progress: {round(num_done/num_nodes*100, 3)}% "
+                  f"({num_done}/{num_nodes} nodes), "
+                  f"{run_realisations/elapsed:.0f} realisations/s, "
+                  f"ETA {format_duration(eta)}.",
+                  num_done=num_done, num_nodes=num_nodes,
+                  realisations=run_realisations, elapsed_seconds=elapsed,
+                  realisations_per_second=run_realisations / elapsed,
+                  eta_seconds=eta)
+
+    task_args = (num_realisations, beta, gamma, num_iterations, master_seed,
+                 size_edges, se_target, max_realisations)
+    if num_workers == 1:
+        init_adjacency(indptr, indices)
+        for block in blocks:
+            block_results = simulate_block(block, *task_args)
+            num_done += len(block)
+            record(*block_results, num_done)
+    else:
+        with process_pool(num_workers, init_adjacency,
+                          (indptr, indices)) as executor:
+            futures = [executor.submit(simulate_block, block, *task_args)
+                       for block in blocks]
+            for future in as_completed(futures):
+                block_results = future.result()
+                num_done += len(block_results[0])
+                record(*block_results, num_done)
+
+    elapsed = time.perf_counter() - start
+    if run_realisations:
+        # Summed over the workers, so it can exceed the elapsed time
+        busy = sum(timings.values())
+        split = ", ".join(f"{part} {seconds/busy*100:.0f}%"
+                          for part, seconds in timings.items())
+        log_event("sweep",
+                  f"Sweep of {run_nodes} nodes took "
+                  f"{format_duration(elapsed)} ({run_realisations} "
+                  f"realisations, {run_realisations/elapsed:.0f}/s); time "
+                  f"in the workers: {split}.",
+                  num_nodes=run_nodes, realisations=run_realisations,
+                  seconds=elapsed, num_workers=num_workers,
+                  **{part + "_seconds": seconds
+                     for part, seconds in timings.items()})
+
+    results = {field: np.array(values) for field, values in results.items()}
+    results["SIZE_BIN_EDGES"] = size_edges
+    report_durations(duration_counts, results["TRUNCATED"], num_iterations)
+    if se_target is not None:
+        counts = results["NUM_REALISATIONS"]
+        capped = np.count_nonzero(results["M_SE"] > se_target)
+        log_event("sequential_sampling",
+                  f"Realisations per node: {counts.min()} to "
+                  f"{counts.max()} ({counts.sum()} in total); {capped} "
+                  f"nodes reached {max_realisations} before the target "
+                  f"standard error {se_target}.",
+                  min_realisations=counts.min(),
+                  max_realisations=counts.max(),
+                  total_realisations=counts.sum(), num_capped=capped)
+    results["M_CI"] = confidence_interval(
+        results["M"], results["M_SE"], confidence)
+    return results
@@ -0,0 +1,34 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+"""Adjacency of the network, set once in every worker by init_adjacency"""
+worker_adjacency = None
+
+
+def adjacency_matrix(indptr, indices, dtype=np.int32):
+    """Sparse adjacency matrix built on top of the CSR arrays of the network"""
+    num_nodes = len(indptr) - 1
+    return sparse.csr_matrix(
+        (np.ones(len(indices), dtype=dtype), indices, indptr),
+        shape=(num_nodes, num_nodes))
+
+
+def init_adjacency(indptr, indices, dtype=np.int32):
+    """Builds the worker's copy of the network, shared by all of its tasks"""
+    global worker_adjacency
+    worker_adjacency = adjacency_matrix(indptr, indices, dtype)
+
+
+def process_pool(num_workers, initializer=None, initargs=()):
+    """ProcessPoolExecutor of num_workers processes, each running
+    initializer(*initargs) once (e.g. init_adjacency)
+
+    Workers are forked where the platform allows it, so that they start
+    without importing the calling script again and get its state for free."""
+    context = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    return ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                               initializer=initializer, initargs=initargs)